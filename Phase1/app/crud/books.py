@@ -1,13 +1,11 @@
 from sqlalchemy.orm import Session
 from sqlalchemy import or_
 from app import models, schemas
-from datetime import datetime
-
-
-from datetime import datetime
+from app.crud import stats
+from datetime import datetime, timezone
 
 def create_book(db: Session, book: schemas.BookCreate):
-    current_time = datetime.now(datetime.timezone.utc)
+    current_time = datetime.now(timezone.utc)
     db_book = models.Book(
         **book.model_dump(),
         available_copies=book.copies,
@@ -15,6 +13,7 @@ def create_book(db: Session, book: schemas.BookCreate):
         updated_at=current_time
     )
     db.add(db_book)
+    stats.record_book_created(db, db_book)
     db.commit()
     db.refresh(db_book)
     return db_book
@@ -42,10 +41,12 @@ def update_book(db: Session, book_id: int, book_data: schemas.BookUpdate):
     if not db_book:
         return None
 
+    old_copies, old_available = db_book.copies, db_book.available_copies
     for key, value in book_data.model_dump(exclude_unset=True).items():
         setattr(db_book, key, value)
 
-    db_book.updated_at = datetime.now(datetime.timezone.utc)
+    db_book.updated_at = datetime.now(timezone.utc)
+    stats.record_book_updated(db, old_copies, old_available, db_book)
     db.commit()
     db.refresh(db_book)
     return db_book
@@ -54,7 +55,8 @@ def update_copies(db: Session, book_id: int, delta: int):
     book = db.query(models.Book).filter(models.Book.id == book_id).first()
     if book:
         book.available_copies += delta
-        book.updated_at = datetime.now(datetime.timezone.utc)
+        book.updated_at = datetime.now(timezone.utc)
+        stats.record_availability_change(db, delta)
         db.commit()
         db.refresh(book)
     return book
@@ -64,6 +66,7 @@ def delete_book(db: Session, book_id: int):
     db_book = get_book_by_id(db, book_id)
     if not db_book:
         return False
+    stats.record_book_deleted(db, db_book)
     db.delete(db_book)
     db.commit()
     return True
@@ -75,6 +78,7 @@ def update_book_availability_on_return(db: Session, book_id: int):
         return None
 
     book.available_copies += 1
-    book.updated_at = datetime.now(datetime.timezone.utc)
+    book.updated_at = datetime.now(timezone.utc)
+    stats.record_availability_change(db, 1)
     db.add(book)
     return book
\ No newline at end of file
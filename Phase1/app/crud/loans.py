@@ -1,18 +1,20 @@
-from datetime import datetime, timedelta
-from sqlalchemy.orm import Session
+from datetime import datetime, timedelta, timezone
+from sqlalchemy.orm import Session, joinedload
 from app import models, schemas
 from app.crud.books import update_book_availability_on_return
+from app.crud import stats
 
 def create_loan(db: Session, loan_data: schemas.LoanCreate):
     loan = models.Loan(
         user_id=loan_data.user_id,
         book_id=loan_data.book_id,
-        issue_date=datetime.now(datetime.timezone.utc),
+        issue_date=datetime.now(timezone.utc),
         due_date=loan_data.due_date,
         status="ACTIVE",
         extensions_count=0
     )
     db.add(loan)
+    stats.record_loan_created(db, loan)
     db.commit()
     db.refresh(loan)
     return loan
@@ -25,24 +27,33 @@ def return_loan(db: Session, loan_id: int):
     if not loan:
         return None
 
-    loan.return_date = datetime.now(datetime.timezone.utc)
+    loan.return_date = datetime.now(timezone.utc)
     loan.status = "RETURNED"
 
     update_book_availability_on_return(db, loan.book_id)
+    stats.record_loan_returned(db, loan)
 
     db.commit()
     db.refresh(loan)
     return loan
 
 def get_loan_history(db: Session, user_id: int):
-    return db.query(models.Loan).filter(models.Loan.user_id == user_id).all()
+    # The response embeds each loan's book: join it in rather than lazy-load it per row
+    return db.query(models.Loan).options(
+        joinedload(models.Loan.book)
+    ).filter(models.Loan.user_id == user_id).order_by(models.Loan.id).all()
 
 def get_overdue_loans(db: Session):
-    now = datetime.now(datetime.timezone.utc)
-    overdue_loans = db.query(models.Loan).filter(
+    # due_date is stored naive (UTC)
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    # Many-to-one: a single query joining user and book instead of two lazy loads per overdue loan
+    overdue_loans = db.query(models.Loan).options(
+        joinedload(models.Loan.user),
+        joinedload(models.Loan.book)
+    ).filter(
         models.Loan.due_date < now,
         models.Loan.status == "ACTIVE"
-    ).all()
+    ).order_by(models.Loan.due_date, models.Loan.id).all()
 
     results = []
     for loan in overdue_loans:
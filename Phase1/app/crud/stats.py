@@ -0,0 +1,203 @@
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import func, case, insert, delete, select, text, and_, or_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+from app import models
+
+COUNTERS = ("total_books", "books_available", "total_users", "books_borrowed")
+
+def _utc_today():
+    return datetime.now(timezone.utc).date()
+
+def _increment(db: Session, model, key: dict, **deltas):
+    # Single upsert statement: concurrent writers add to the row instead of overwriting it
+    upsert = pg_insert if db.bind.dialect.name == "postgresql" else sqlite_insert
+    table = model.__table__
+    stmt = upsert(table).values(**key, **deltas)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(key),
+        set_={name: table.c[name] + stmt.excluded[name] for name in deltas}
+    )
+    db.execute(stmt)
+
+def bump_counters(db: Session, **deltas):
+    for name, delta in deltas.items():
+        if delta:
+            _increment(db, models.StatsCounter, {"name": name}, value=delta)
+
+# Write hooks: call before the commit of the change they describe
+
+def record_loan_created(db: Session, loan: models.Loan):
+    bump_counters(db, books_borrowed=1)
+    _increment(db, models.BookLoanCount, {"book_id": loan.book_id}, borrow_count=1)
+    _increment(db, models.UserLoanCount, {"user_id": loan.user_id}, books_borrowed=1, current_borrows=1)
+    _increment(db, models.DailyLoanActivity, {"day": _utc_today()}, loans=1, returns=0)
+
+def record_loan_returned(db: Session, loan: models.Loan):
+    bump_counters(db, books_borrowed=-1)
+    _increment(db, models.UserLoanCount, {"user_id": loan.user_id}, books_borrowed=0, current_borrows=-1)
+    _increment(db, models.DailyLoanActivity, {"day": _utc_today()}, loans=0, returns=1)
+
+def record_availability_change(db: Session, delta: int):
+    bump_counters(db, books_available=delta)
+
+def record_book_created(db: Session, book: models.Book):
+    bump_counters(db, total_books=book.copies or 0, books_available=book.available_copies or 0)
+
+def record_book_updated(db: Session, old_copies: int, old_available: int, book: models.Book):
+    bump_counters(
+        db,
+        total_books=(book.copies or 0) - (old_copies or 0),
+        books_available=(book.available_copies or 0) - (old_available or 0)
+    )
+
+def record_book_deleted(db: Session, book: models.Book):
+    bump_counters(db, total_books=-(book.copies or 0), books_available=-(book.available_copies or 0))
+
+def record_user_created(db: Session):
+    bump_counters(db, total_users=1)
+
+def rebuild_rollups(db: Session):
+    # Recompute every rollup from the base tables, e.g. after a restore or a manual data fix.
+    # Writers bump the rollups in the same transaction as their base-table change, so blocking rollup
+    # writes until this commits means every loan is either in the recount or added on top of it, never
+    # both or neither. PostgreSQL: EXCLUSIVE still lets readers see the old rollups meanwhile.
+    # SQLite: the first DELETE takes the database write lock, which does the same.
+    rollups = (models.StatsCounter, models.BookLoanCount, models.UserLoanCount, models.DailyLoanActivity)
+    if db.bind.dialect.name == "postgresql":
+        db.execute(text("LOCK TABLE " + ", ".join(m.__tablename__ for m in rollups) + " IN EXCLUSIVE MODE"))
+    for model in rollups:
+        db.execute(delete(model))
+
+    counters = {
+        "total_books": db.query(func.coalesce(func.sum(models.Book.copies), 0)).scalar(),
+        "books_available": db.query(func.coalesce(func.sum(models.Book.available_copies), 0)).scalar(),
+        "total_users": db.query(func.count(models.User.id)).scalar(),
+        "books_borrowed": db.query(func.count(models.Loan.id)).filter(models.Loan.status == "ACTIVE").scalar(),
+    }
+    db.execute(insert(models.StatsCounter), [{"name": k, "value": v} for k, v in counters.items()])
+
+    db.execute(insert(models.BookLoanCount).from_select(
+        ["book_id", "borrow_count"],
+        select(models.Loan.book_id, func.count(models.Loan.id))
+        .where(models.Loan.book_id.isnot(None))
+        .group_by(models.Loan.book_id)
+    ))
+    db.execute(insert(models.UserLoanCount).from_select(
+        ["user_id", "books_borrowed", "current_borrows"],
+        select(
+            models.Loan.user_id,
+            func.count(models.Loan.id),
+            func.sum(case((models.Loan.status == "ACTIVE", 1), else_=0))
+        )
+        .where(models.Loan.user_id.isnot(None))
+        .group_by(models.Loan.user_id)
+    ))
+
+    activity = {}
+    for issue_date, return_date in db.query(models.Loan.issue_date, models.Loan.return_date):
+        for moment, field in ((issue_date, "loans"), (return_date, "returns")):
+            if moment is None:
+                continue
+            day = (moment.astimezone(timezone.utc) if moment.tzinfo else moment).date()
+            activity.setdefault(day, {"day": day, "loans": 0, "returns": 0})[field] += 1
+    if activity:
+        db.execute(insert(models.DailyLoanActivity), list(activity.values()))
+    db.commit()
+
+def ensure_rollups(db: Session):
+    if db.query(models.StatsCounter).first() is None:
+        rebuild_rollups(db)
+
+# Reads
+
+def get_overview(db: Session):
+    counters = {name: 0 for name in COUNTERS}
+    counters.update(dict(db.query(models.StatsCounter.name, models.StatsCounter.value)))
+    today = db.get(models.DailyLoanActivity, _utc_today())
+    # Overdue depends on the clock, so it is counted from the (status, due_date) index instead
+    overdue_loans = db.query(func.count(models.Loan.id)).filter(
+        models.Loan.status == "ACTIVE",
+        models.Loan.due_date < datetime.now(timezone.utc)
+    ).scalar()
+    return {
+        **counters,
+        "overdue_loans": overdue_loans,
+        "loans_today": today.loans if today else 0,
+        "returns_today": today.returns if today else 0
+    }
+
+def live_loan_counts_query(db: Session, now: datetime):
+    # Half-open UTC day range: comparing the raw column keeps the date indexes usable
+    day_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    day_end = day_start + timedelta(days=1)
+    active = models.Loan.status == "ACTIVE"
+    issued_today = and_(models.Loan.issue_date >= day_start, models.Loan.issue_date < day_end)
+    returned_today = and_(models.Loan.return_date >= day_start, models.Loan.return_date < day_end)
+
+    # One pass over loans; the WHERE lets the planner OR together the status and date index ranges.
+    # benchmarks/check_overview_plan.py asserts that plan shape
+    return db.query(
+        func.count().filter(active).label("books_borrowed"),
+        func.count().filter(and_(active, models.Loan.due_date < now)).label("overdue_loans"),
+        func.count().filter(issued_today).label("loans_today"),
+        func.count().filter(returned_today).label("returns_today")
+    ).filter(or_(active, issued_today, returned_today))
+
+def get_live_overview(db: Session):
+    loans = live_loan_counts_query(db, datetime.now(timezone.utc)).one()
+    books = db.query(
+        func.coalesce(func.sum(models.Book.copies), 0).label("total_books"),
+        func.coalesce(func.sum(models.Book.available_copies), 0).label("books_available")
+    ).one()
+    total_users = db.query(func.count(models.User.id)).scalar()
+
+    return {
+        "total_books": books.total_books,
+        "total_users": total_users,
+        "books_available": books.books_available,
+        "books_borrowed": loans.books_borrowed,
+        "overdue_loans": loans.overdue_loans,
+        "loans_today": loans.loans_today,
+        "returns_today": loans.returns_today
+    }
+
+def get_popular_books(db: Session, limit: int = 10):
+    return (
+        db.query(
+            models.BookLoanCount.book_id,
+            models.Book.title,
+            models.Book.author,
+            models.BookLoanCount.borrow_count
+        )
+        .join(models.Book, models.Book.id == models.BookLoanCount.book_id)
+        .filter(models.BookLoanCount.borrow_count > 0)
+        .order_by(models.BookLoanCount.borrow_count.desc(), models.BookLoanCount.book_id)
+        .limit(limit)
+        .all()
+    )
+
+def get_active_users(db: Session, limit: int = 10):
+    rows = (
+        db.query(
+            models.UserLoanCount.user_id,
+            models.User.name,
+            models.UserLoanCount.books_borrowed,
+            models.UserLoanCount.current_borrows
+        )
+        .join(models.User, models.User.id == models.UserLoanCount.user_id)
+        .filter(models.UserLoanCount.books_borrowed > 0)
+        .order_by(models.UserLoanCount.books_borrowed.desc(), models.UserLoanCount.user_id)
+        .limit(limit)
+        .all()
+    )
+    return [
+        {
+            "user_id": row.user_id,
+            "name": row.name,
+            "books_borrowed": row.books_borrowed,
+            "current_borrows": row.current_borrows
+        }
+        for row in rows
+    ]
@@ -1,9 +1,11 @@
 from sqlalchemy.orm import Session
 from app import models, schemas
+from app.crud import stats
 
 def create_user(db: Session, user: schemas.UserCreate):
     db_user = models.User(**user.dict())
     db.add(db_user)
+    stats.record_user_created(db)
     db.commit()
     db.refresh(db_user)
     return db_user
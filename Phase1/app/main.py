@@ -1,13 +1,27 @@
 from fastapi import FastAPI
 from app.routers import users, books, loans, stats
-from app.database import engine
+from app.database import engine, SessionLocal, ensure_indexes
 from app.models import Base
+from app.crud.stats import ensure_rollups
+from app import query_budget
 
 Base.metadata.create_all(bind=engine)
+ensure_indexes(Base.metadata)
+
+# Backfill the stats rollups the first time they are created
+with SessionLocal() as db:
+    ensure_rollups(db)
 
 app = FastAPI(title="Smart Library System")
 
+# Count SQL statements per request (x-sql-queries) against the route's budget, so N+1 regressions surface
+query_budget.instrument_engine(engine)
+app.add_middleware(query_budget.QueryCountMiddleware)
+
 app.include_router(users.router)
 app.include_router(books.router)
 app.include_router(loans.router)
 app.include_router(stats.router)
+
+if stats.STATS_ADMIN_TOKEN:
+    app.include_router(stats.admin_router)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Enum
+from sqlalchemy import Column, Integer, String, Date, DateTime, ForeignKey, Enum, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database import Base
@@ -47,3 +47,34 @@ class Loan(Base):
 
     user = relationship("User", back_populates="loans")
     book = relationship("Book", back_populates="loans")
+
+    # Overdue counts stay live (they depend on the clock); the date indexes serve the live overview's day ranges
+    __table_args__ = (
+        Index("ix_loans_status_due_date", "status", "due_date"),
+        Index("ix_loans_issue_date", "issue_date"),
+        Index("ix_loans_return_date", "return_date"),
+    )
+
+# Rollups maintained by app.crud.stats alongside loan/book/user writes
+
+class StatsCounter(Base):
+    __tablename__ = "stats_counters"
+    name = Column(String, primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
+
+class BookLoanCount(Base):
+    __tablename__ = "stats_book_loans"
+    book_id = Column(Integer, ForeignKey("books.id", ondelete="CASCADE"), primary_key=True)
+    borrow_count = Column(Integer, nullable=False, default=0, index=True)
+
+class UserLoanCount(Base):
+    __tablename__ = "stats_user_loans"
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    books_borrowed = Column(Integer, nullable=False, default=0, index=True)
+    current_borrows = Column(Integer, nullable=False, default=0)
+
+class DailyLoanActivity(Base):
+    __tablename__ = "stats_daily_loans"
+    day = Column(Date, primary_key=True)
+    loans = Column(Integer, nullable=False, default=0)
+    returns = Column(Integer, nullable=False, default=0)
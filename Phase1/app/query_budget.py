@@ -0,0 +1,62 @@
+from contextvars import ContextVar
+from sqlalchemy import event
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Routes declare their own budget with Depends(query_budget.budget(n)); this covers the rest (0: no limit)
+SQL_QUERY_BUDGET = int(os.getenv("SQL_QUERY_BUDGET", "0"))
+# Test mode: fail requests that go over budget; otherwise they are counted (x-sql-queries) and logged
+SQL_QUERY_BUDGET_ENFORCE = os.getenv("SQL_QUERY_BUDGET_ENFORCE", "false").lower() in ("1", "true", "yes")
+
+# A mutable [count, budget] per request; the list is shared with the threadpool the sync handlers run in
+_queries = ContextVar("sql_queries", default=None)
+
+class QueryBudgetExceeded(RuntimeError):
+    pass
+
+def budget(limit: int):
+    # Route dependency; it runs before the handler issues any SQL
+    def set_budget():
+        counter = _queries.get()
+        if counter is not None:
+            counter[1] = limit
+    return set_budget
+
+def instrument_engine(engine, enforce: bool = SQL_QUERY_BUDGET_ENFORCE):
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        counter = _queries.get()
+        if counter is None:
+            return
+        counter[0] += 1
+        limit = counter[1]
+        if not limit or counter[0] != limit + 1:
+            return
+        message = f"Request issued more than {limit} SQL statements: {statement.strip()[:200]}"
+        # Raise at the offending statement so the traceback points at the N+1 loop
+        if enforce:
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
+
+class QueryCountMiddleware:
+    # Pure ASGI so the counter is set in the context the route handler runs in
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        counter = [0, SQL_QUERY_BUDGET]
+        token = _queries.set(counter)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [*message.get("headers", []), (b"x-sql-queries", str(counter[0]).encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _queries.reset(token)
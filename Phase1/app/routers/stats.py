@@ -1,19 +1,26 @@
-from typing import List
-from fastapi import APIRouter, Depends
+from typing import List, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException
 from sqlalchemy.orm import Session
-from sqlalchemy import func, case, and_, cast, Date
-from datetime import date, datetime
+from sqlalchemy import func, case
+import os
+import secrets
 
-from app import models, schemas
+from app import models, schemas, query_budget
+from app.crud import stats as stats_crud
 from app.database import get_db
 
+# "rollup" reads the counters maintained on each write; "live" aggregates the base tables per request
+STATS_SOURCE = os.getenv("STATS_SOURCE", "rollup").lower()
+
 router = APIRouter(
     prefix="/api/stats",
     tags=["stats"]
 )
 
-@router.get("/books/popular", response_model=list[schemas.PopularBook])
+@router.get("/books/popular", response_model=list[schemas.PopularBook], dependencies=[Depends(query_budget.budget(1))])
 def get_most_borrowed_books(db: Session = Depends(get_db)):
+    if STATS_SOURCE == "rollup":
+        return stats_crud.get_popular_books(db)
     result = (
         db.query(
             models.Loan.book_id,
@@ -29,8 +36,10 @@ def get_most_borrowed_books(db: Session = Depends(get_db)):
     )
     return result
 
-@router.get("/users/active", response_model=List[schemas.ActiveUser])
+@router.get("/users/active", response_model=List[schemas.ActiveUser], dependencies=[Depends(query_budget.budget(1))])
 def get_active_users(db: Session = Depends(get_db)):
+    if STATS_SOURCE == "rollup":
+        return stats_crud.get_active_users(db)
     results = db.query(
         models.User.id.label("user_id"),
         models.User.name,
@@ -53,30 +62,27 @@ def get_active_users(db: Session = Depends(get_db)):
     ]
 
 
-@router.get("/overview", response_model=schemas.OverviewStats)
+@router.get("/overview", response_model=schemas.OverviewStats, dependencies=[Depends(query_budget.budget(3))])
 def get_overview_stats(db: Session = Depends(get_db)):
-    total_books = db.query(func.sum(models.Book.copies)).scalar() or 0
-    total_users = db.query(func.count(models.User.id)).scalar()
-    books_available = db.query(func.sum(models.Book.available_copies)).scalar() or 0
-    books_borrowed = db.query(func.count()).select_from(models.Loan).filter(models.Loan.status == "ACTIVE").scalar()
-    overdue_loans = db.query(func.count()).select_from(models.Loan).filter(
-        models.Loan.status == "ACTIVE",
-        models.Loan.due_date < datetime.now(datetime.timezone.utc)
-    ).scalar()
-    today = date.today()
-    loans_today = db.query(func.count()).select_from(models.Loan).filter(
-        cast(models.Loan.issue_date, Date) == today
-    ).scalar()
-    returns_today = db.query(func.count()).select_from(models.Loan).filter(
-        cast(models.Loan.return_date, Date) == today
-    ).scalar()
+    if STATS_SOURCE == "rollup":
+        return stats_crud.get_overview(db)
+    return stats_crud.get_live_overview(db)
+
+# Operator-only: app.main mounts this router only when STATS_ADMIN_TOKEN is set, and every call must send it
+STATS_ADMIN_TOKEN = os.getenv("STATS_ADMIN_TOKEN")
+
+def require_admin_token(x_admin_token: Optional[str] = Header(None)):
+    if not STATS_ADMIN_TOKEN or not x_admin_token or not secrets.compare_digest(x_admin_token, STATS_ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+admin_router = APIRouter(
+    prefix="/internal/stats",
+    tags=["admin"],
+    dependencies=[Depends(require_admin_token)],
+    include_in_schema=False
+)
 
-    return {
-        "total_books": total_books,
-        "total_users": total_users,
-        "books_available": books_available,
-        "books_borrowed": books_borrowed,
-        "overdue_loans": overdue_loans,
-        "loans_today": loans_today,
-        "returns_today": returns_today
-    }
+@admin_router.post("/rebuild", response_model=schemas.OverviewStats)
+def rebuild_stats(db: Session = Depends(get_db)):
+    stats_crud.rebuild_rollups(db)
+    return stats_crud.get_overview(db)
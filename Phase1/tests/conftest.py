@@ -0,0 +1,8 @@
+import os
+import sys
+import tempfile
+
+# Before app is imported: a throwaway SQLite database and budgets that fail the request when exceeded
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "test.db")
+os.environ["SQL_QUERY_BUDGET_ENFORCE"] = "true"
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
@@ -0,0 +1,52 @@
+from datetime import datetime, timedelta, timezone
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.crud import loans as loan_crud
+from app.query_budget import QueryBudgetExceeded
+from app.routers import stats
+from app import models
+
+LOANS = 5
+
+@pytest.fixture(scope="module")
+def client():
+    client = TestClient(app)
+    overdue = (datetime.now(timezone.utc) - timedelta(days=3)).isoformat()
+    # Several overdue loans across different users and books, so a per-row lazy load would show up
+    for i in range(1, LOANS + 1):
+        assert client.post("/api/users/", json={"name": f"user {i}", "email": f"user{i}@example.com", "role": "student"}).status_code == 200
+        assert client.post("/api/books/", json={"title": f"book {i}", "author": "author", "isbn": f"isbn-{i}", "copies": 2}).status_code == 201
+        assert client.post("/api/loans/", json={"user_id": 1, "book_id": i, "due_date": overdue}).status_code == 200
+        assert client.post("/api/loans/", json={"user_id": i, "book_id": i, "due_date": overdue}).status_code == 200
+    return client
+
+def queries(response):
+    assert response.status_code == 200, response.text
+    return int(response.headers["x-sql-queries"])
+
+def test_overdue_is_one_query(client):
+    response = client.get("/api/loans/overdue")
+    assert len(response.json()) == 2 * LOANS
+    assert queries(response) == 1
+
+def test_history_is_one_query(client):
+    response = client.get("/api/loans/1")
+    assert len(response.json()) == LOANS + 1
+    assert queries(response) == 1
+
+@pytest.mark.parametrize("source", ["rollup", "live"])
+def test_overview_queries(client, source, monkeypatch):
+    monkeypatch.setattr(stats, "STATS_SOURCE", source)
+    response = client.get("/api/stats/overview")
+    assert response.json()["overdue_loans"] == 2 * LOANS
+    assert queries(response) <= 3
+
+def test_n_plus_one_fails_the_request(client, monkeypatch):
+    def lazy_overdue(db):
+        loans = db.query(models.Loan).filter(models.Loan.status == "ACTIVE").all()
+        return [{"id": loan.id, "user": loan.user, "book": loan.book, "issue_date": loan.issue_date,
+                 "due_date": loan.due_date, "days_overdue": 1} for loan in loans]
+    monkeypatch.setattr(loan_crud, "get_overdue_loans", lazy_overdue)
+    with pytest.raises(QueryBudgetExceeded):
+        client.get("/api/loans/overdue")
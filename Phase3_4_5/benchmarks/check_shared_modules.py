@@ -0,0 +1,66 @@
+"""Check that the per-service copies of the shared modules have not drifted.
+
+Every service image is built from its own directory, so log.py, tracing.py
+and instrumentation.py are copied into each service's app package (and
+leader.py into book-service's) rather than imported from a shared one. loan-service holds the reference copy; a
+change there has to be copied to the other services, and this check fails
+until it is. The only allowed differences are the SERVICE_NAME default and
+the SQLAlchemy hooks (instrument_engine) that stats-service, which has no
+database, leaves out.
+
+    python benchmarks/check_shared_modules.py
+"""
+import ast
+import difflib
+import os
+import re
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+REFERENCE = "loan-service"
+SERVICES = ["book-service", "user-service", "stats-service"]
+# Module -> the services, besides loan-service, that carry a copy
+MODULES = {
+    "log.py": SERVICES,
+    "tracing.py": SERVICES,
+    "instrumentation.py": SERVICES,
+    "leader.py": ["book-service"],
+}
+# Top-level definitions a service may leave out of its copy
+OMITTED = {"stats-service": {"instrument_engine"}}
+
+def normalized(path: str, omitted=()):
+    with open(path) as f:
+        source = f.read()
+    # The SERVICE_NAME default is the service's own name
+    source = re.sub(r'(SERVICE_NAME = os\.getenv\("SERVICE_NAME", )"[\w-]+"\)', r'\1"<service>")', source)
+    lines = source.splitlines()
+    for node in reversed(ast.parse(source).body):
+        if getattr(node, "name", None) in omitted:
+            del lines[node.lineno - 1:node.end_lineno]
+    # Removing a definition leaves its surrounding blank lines behind
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip("\n").splitlines()
+
+def main():
+    problems = []
+    for module in MODULES:
+        for service in MODULES[module]:
+            path = os.path.join(ROOT, service, "app", module)
+            if not os.path.exists(path):
+                problems.append(f"{service}/app/{module} is missing")
+                continue
+            expected = normalized(os.path.join(ROOT, REFERENCE, "app", module), OMITTED.get(service, ()))
+            actual = normalized(path)
+            if actual != expected:
+                diff = difflib.unified_diff(
+                    expected, actual, f"{REFERENCE}/app/{module}", f"{service}/app/{module}", lineterm="", n=1
+                )
+                problems.append("\n".join(diff))
+    for problem in problems:
+        print(problem, file=sys.stderr)
+    copies = sum(len(services) for services in MODULES.values())
+    print(f"{len(MODULES)} modules, {copies} copies: {'drifted' if problems else 'in sync'}")
+    sys.exit(1 if problems else 0)
+
+if __name__ == "__main__":
+    main()
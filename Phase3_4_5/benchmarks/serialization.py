@@ -0,0 +1,131 @@
+"""Response serialization microbenchmark for the hot read endpoints.
+
+Times what happens to a page after the query returns, per 100-item page:
+FastAPI's default path (response_model validation of the ORM rows, then
+jsonable_encoder and json.dumps in JSONResponse) against the FAST_JSON path
+(row-to-dict plus orjson). Covers a book-service search page and a
+loan-service history page, and checks both paths produce the same JSON.
+
+    python benchmarks/serialization.py --items 100 --iterations 2000
+"""
+import argparse
+import asyncio
+import inspect
+import json
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute, serialize_response
+
+def load_service(name):
+    # Each service has its own top-level "app" package; import one at a time
+    for module in [m for m in sys.modules if m == "app" or m.startswith("app.")]:
+        del sys.modules[module]
+    sys.path.insert(0, os.path.join(ROOT, name))
+    try:
+        from app import fast_json, models, schemas
+    finally:
+        sys.path.pop(0)
+    return fast_json, models, schemas
+
+def response_field(response_model):
+    async def endpoint():
+        pass
+    return APIRoute("/", endpoint, response_model=response_model).response_field
+
+async def default_body(field, content):
+    # What FastAPI does with a route's return value when no Response is returned
+    value = await serialize_response(field=field, response_content=content, is_coroutine=True)
+    return JSONResponse(value).body
+
+async def run(render):
+    result = render()
+    return await result if inspect.isawaitable(result) else result
+
+async def measure(name, render, iterations):
+    for _ in range(min(iterations, 100)):
+        await run(render)
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        await run(render)
+        samples.append((time.perf_counter() - start) * 1_000_000)
+    samples.sort()
+    return {
+        "name": name,
+        "mean_us": round(statistics.fmean(samples), 1),
+        "p50_us": round(samples[len(samples) // 2], 1),
+        "p99_us": round(samples[int(len(samples) * 0.99) - 1], 1),
+    }
+
+def book_page(models, items):
+    now = datetime.now(timezone.utc)
+    books = [
+        models.Book(
+            id=i, title=f"The Collected Works, Volume {i}", author=f"Author {i % 37}", isbn=f"978{i:010d}",
+            copies=5, available_copies=i % 6, created_at=now - timedelta(days=i), updated_at=now if i % 2 else None,
+        )
+        for i in range(1, items + 1)
+    ]
+    return {"books": books, "total": 12345, "page": 1, "per_page": items, "next_cursor": "eyJpZCI6IDEwMH0"}
+
+def loan_history(models, items):
+    now = datetime.now(timezone.utc)
+    loans = [
+        {
+            "id": i,
+            "book": {"id": i, "title": f"The Collected Works, Volume {i}", "author": f"Author {i % 37}"},
+            "issue_date": now - timedelta(days=30 + i),
+            "due_date": (now - timedelta(days=16 + i)).replace(tzinfo=None),
+            "return_date": (now - timedelta(days=20 + i)).replace(tzinfo=None) if i % 3 else None,
+            "status": models.LoanStatus.RETURNED if i % 3 else models.LoanStatus.ACTIVE,
+        }
+        for i in range(1, items + 1)
+    ]
+    return {"loans": loans, "total": items, "next_cursor": None}
+
+async def compare(label, default, fast, iterations):
+    default_json, fast_json = await run(default), await run(fast)
+    if json.loads(default_json) != json.loads(fast_json):
+        raise SystemExit(f"{label}: fast path output differs from the response_model output")
+    results = [await measure("response_model + JSONResponse", default, iterations),
+               await measure("FAST_JSON (dict + orjson)", fast, iterations)]
+    speedup = results[0]["mean_us"] / results[1]["mean_us"]
+    return {"page": label, "bytes": len(fast_json), "results": results, "speedup": round(speedup, 1)}
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=100, help="Items per page")
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    os.environ.setdefault("BOOK_DB_URL", "sqlite://")
+    os.environ.setdefault("LOAN_DB_URL", "sqlite://")
+    reports = []
+
+    fast, models, schemas = load_service("book-service")
+    page = book_page(models, args.items)
+    field = response_field(schemas.BookSearchResponse)
+    reports.append(await compare(
+        "book search", lambda: default_body(field, page),
+        lambda: fast.FastJSONResponse(fast.search_page_to_dict(page)).body, args.iterations
+    ))
+
+    fast, models, schemas = load_service("loan-service")
+    history = loan_history(models, args.items)
+    field = response_field(schemas.UserLoanHistory)
+    reports.append(await compare(
+        "loan history", lambda: default_body(field, history),
+        lambda: fast.FastJSONResponse(history).body, args.iterations
+    ))
+
+    print(json.dumps({"items": args.items, "iterations": args.iterations, "pages": reports}, indent=2))
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,211 @@
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from pydantic import ValidationError
+from fastapi import HTTPException
+from typing import AsyncIterator
+from app import models, schemas
+from app.search import inverted_index
+import argparse
+import asyncio
+import codecs
+import csv
+import json
+import os
+
+BULK_IMPORT_BATCH_SIZE = int(os.getenv("BULK_IMPORT_BATCH_SIZE", "5000"))
+BULK_IMPORT_MAX_ERRORS = int(os.getenv("BULK_IMPORT_MAX_ERRORS", "1000"))
+IMPORT_COLUMNS = ("title", "author", "isbn", "copies")
+
+FORMATS_BY_CONTENT_TYPE = {
+    "text/csv": "csv",
+    "application/csv": "csv",
+    "application/x-ndjson": "jsonl",
+    "application/jsonl": "jsonl",
+    "application/json-lines": "jsonl",
+}
+
+def detect_format(content_type: str, explicit: str = None) -> str:
+    if explicit:
+        return explicit
+    fmt = FORMATS_BY_CONTENT_TYPE.get((content_type or "").split(";")[0].strip().lower())
+    if not fmt:
+        raise HTTPException(status_code=415, detail="Send text/csv or application/x-ndjson, or pass ?format=csv|jsonl")
+    return fmt
+
+async def iter_lines(chunks: AsyncIterator[bytes]):
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line + "\n"
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+async def iter_records(chunks: AsyncIterator[bytes], fmt: str):
+    # Yields (row_number, dict or error message) without holding the whole upload in memory
+    lines = iter_lines(chunks)
+    if fmt == "jsonl":
+        row = 0
+        async for line in lines:
+            if not line.strip():
+                continue
+            row += 1
+            try:
+                record = json.loads(line)
+                yield row, record if isinstance(record, dict) else "Expected a JSON object"
+            except ValueError as e:
+                yield row, f"Invalid JSON: {e}"
+        return
+
+    header = None
+    row = 0
+    buffered = ""
+    async for line in lines:
+        buffered += line
+        # A quoted field may contain newlines; wait until the quotes balance
+        if buffered.count('"') % 2:
+            continue
+        values = next(csv.reader([buffered]), [])
+        buffered = ""
+        if not any(v.strip() for v in values):
+            continue
+        if header is None:
+            header = [v.strip().lower() for v in values]
+            missing = [c for c in IMPORT_COLUMNS if c not in header]
+            if missing:
+                raise HTTPException(status_code=400, detail=f"CSV header is missing columns: {', '.join(missing)}")
+            continue
+        row += 1
+        yield row, dict(zip(header, values))
+    if buffered.strip():
+        yield row + 1, "Unterminated quoted field"
+
+def upsert_statement(dialect_name: str):
+    insert = pg_insert if dialect_name == "postgresql" else sqlite_insert
+    stmt = insert(models.Book.__table__)
+    # Re-importing a title keeps copies on loan: available shifts by the change in total copies.
+    # The WHERE skips a title whose new total fell below its loans after on_loan_conflicts checked it
+    return stmt.on_conflict_do_update(
+        index_elements=[models.Book.isbn],
+        where=models.Book.copies - models.Book.available_copies <= stmt.excluded.copies,
+        set_={
+            "title": stmt.excluded.title,
+            "author": stmt.excluded.author,
+            "copies": stmt.excluded.copies,
+            "available_copies": models.Book.available_copies + stmt.excluded.copies - models.Book.copies,
+            "updated_at": func.now(),
+        },
+    )
+
+async def copy_upsert(db: AsyncSession, rows):
+    # COPY into a session-local staging table, then one INSERT ... SELECT ... ON CONFLICT
+    conn = await db.connection()
+    raw = (await conn.get_raw_connection()).driver_connection
+    await raw.execute(
+        "CREATE TEMP TABLE IF NOT EXISTS books_import "
+        "(title text, author text, isbn text, copies integer) ON COMMIT DELETE ROWS"
+    )
+    await raw.copy_records_to_table(
+        "books_import",
+        records=[tuple(r[c] for c in IMPORT_COLUMNS) for r in rows],
+        columns=list(IMPORT_COLUMNS),
+    )
+    await raw.execute(
+        "INSERT INTO books (title, author, isbn, copies, available_copies) "
+        "SELECT title, author, isbn, copies, copies FROM books_import "
+        "ON CONFLICT (isbn) DO UPDATE SET title = excluded.title, author = excluded.author, "
+        "copies = excluded.copies, "
+        "available_copies = books.available_copies + excluded.copies - books.copies, "
+        "updated_at = now() "
+        "WHERE books.copies - books.available_copies <= excluded.copies"
+    )
+
+async def on_loan_conflicts(db: AsyncSession, rows):
+    # Rows that would set copies below the number currently on loan, which would make available_copies negative
+    on_loan = dict((await db.execute(
+        select(models.Book.isbn, models.Book.copies - models.Book.available_copies)
+        .where(models.Book.isbn.in_([r["isbn"] for r in rows]))
+    )).all())
+    return {r["isbn"]: on_loan[r["isbn"]] for r in rows if on_loan.get(r["isbn"], 0) > r["copies"]}
+
+async def write_batch(db: AsyncSession, rows):
+    conflicts = await on_loan_conflicts(db, rows)
+    rows = [r for r in rows if r["isbn"] not in conflicts]
+    if not rows:
+        return conflicts
+    dialect_name = db.bind.dialect.name
+    if dialect_name == "postgresql" and db.bind.driver == "asyncpg":
+        await copy_upsert(db, rows)
+    else:
+        # executemany with one cached statement; a multi-row VALUES would be recompiled per batch
+        await db.execute(upsert_statement(dialect_name), [{**r, "available_copies": r["copies"]} for r in rows])
+    await db.commit()
+    return conflicts
+
+async def import_books(db: AsyncSession, chunks: AsyncIterator[bytes], fmt: str):
+    imported = 0
+    failed = 0
+    errors = []
+    # Keyed by ISBN: a batch may not upsert the same row twice, so the last occurrence wins
+    batch = {}
+
+    def record_error(row, isbn, message):
+        nonlocal failed
+        failed += 1
+        if len(errors) < BULK_IMPORT_MAX_ERRORS:
+            errors.append({"row": row, "isbn": isbn, "error": message})
+
+    async def flush(batch):
+        conflicts = await write_batch(db, [book for _, book in batch.values()])
+        for isbn, on_loan in conflicts.items():
+            record_error(batch[isbn][0], isbn, f"copies is below the {on_loan} copies currently on loan")
+        return len(batch) - len(conflicts)
+
+    async for row, record in iter_records(chunks, fmt):
+        if isinstance(record, str):
+            record_error(row, None, record)
+            continue
+        try:
+            book = schemas.BookCreate(**{c: record.get(c) for c in IMPORT_COLUMNS})
+        except ValidationError as e:
+            record_error(row, record.get("isbn"), "; ".join(
+                f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in e.errors()
+            ))
+            continue
+        batch[book.isbn] = (row, book.model_dump())
+        if len(batch) >= BULK_IMPORT_BATCH_SIZE:
+            imported += await flush(batch)
+            batch = {}
+    if batch:
+        imported += await flush(batch)
+
+    # This worker's search index reloads on the next query; other workers' within INVERTED_INDEX_MAX_AGE
+    inverted_index.clear()
+    return {"imported": imported, "failed": failed, "errors": errors}
+
+async def read_file(path: str, chunk_size: int = 1 << 20):
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            yield chunk
+
+async def main():
+    from app.database import SessionLocal, engine
+
+    parser = argparse.ArgumentParser(description="Bulk import books from a CSV or JSONL file")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=["csv", "jsonl"])
+    args = parser.parse_args()
+    fmt = args.format or ("jsonl" if args.path.endswith((".jsonl", ".ndjson")) else "csv")
+
+    async with SessionLocal() as db:
+        result = await import_books(db, read_file(args.path), fmt)
+    await engine.dispose()
+    print(json.dumps(result, indent=2))
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,10 +1,19 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import or_, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import delete, or_, func, select, text, true, update
+from sqlalchemy.exc import IntegrityError
 from app import models, schemas
+from app.pagination import encode_cursor, decode_cursor
+from app.search import resolve_engine, tokenize, fulltext_search, inverted_search, index_book, unindex_book
 from fastapi import HTTPException
+from typing import List, Optional
+from datetime import datetime, timedelta, timezone
+import os
 
-def create_book(db: Session, book: schemas.BookCreate):
-    existing_book = db.query(models.Book).filter(models.Book.isbn == book.isbn).first()
+# Long enough to outlive every retry and compensation of the caller's outbox
+AVAILABILITY_KEY_TTL = timedelta(hours=float(os.getenv("AVAILABILITY_KEY_TTL_HOURS", "24")))
+
+async def create_book(db: AsyncSession, book: schemas.BookCreate):
+    existing_book = (await db.execute(select(models.Book).where(models.Book.isbn == book.isbn))).scalars().first()
     if existing_book:
         raise HTTPException(status_code=400, detail="ISBN already exists")
     db_book = models.Book(
@@ -12,59 +21,190 @@ def create_book(db: Session, book: schemas.BookCreate):
         available_copies=book.copies
     )
     db.add(db_book)
-    db.commit()
-    db.refresh(db_book)
+    await db.commit()
+    await db.refresh(db_book)
+    index_book(db_book)
     return db_book
 
-def get_book_by_id(db: Session, book_id: int):
-    return db.query(models.Book).filter(models.Book.id == book_id).first()
+async def get_book_by_id(db: AsyncSession, book_id: int):
+    return await db.get(models.Book, book_id)
+
+async def get_book_version(db: AsyncSession, book_id: int):
+    # Plain columns behind the ETag, without building an ORM object, for conditional GETs that usually end in a 304
+    return (await db.execute(select(
+        models.Book.id, models.Book.updated_at, models.Book.created_at, models.Book.title,
+        models.Book.author, models.Book.isbn, models.Book.copies, models.Book.available_copies
+    ).where(models.Book.id == book_id))).first()
+
+async def get_books_by_ids(db: AsyncSession, book_ids: List[int]):
+    if not book_ids:
+        return []
+    return (await db.execute(select(models.Book).where(models.Book.id.in_(book_ids)))).scalars().all()
+
+async def get_inventory_summary(db: AsyncSession):
+    row = (await db.execute(select(
+        func.coalesce(func.sum(models.Book.copies), 0).label("total_books"),
+        func.coalesce(func.sum(models.Book.available_copies), 0).label("books_available")
+    ))).one()
+    return {"total_books": row.total_books, "books_available": row.books_available}
+
+async def estimate_book_count(db: AsyncSession):
+    # Planner statistics instead of a full count for unfiltered listings on PostgreSQL
+    if db.bind.dialect.name != "postgresql":
+        return None
+    estimate = (await db.execute(text("SELECT reltuples::bigint FROM pg_class WHERE relname = 'books'"))).scalar()
+    return max(estimate, 0) if estimate is not None else None
 
-def search_books(db: Session, search: str = None, page: int = 1, per_page: int = 10):
-    query = db.query(models.Book)
-    if search:
-        query = query.filter(
-            or_(
+async def search_books(db: AsyncSession, search: str = None, page: int = 1, per_page: int = 10,
+                       cursor: Optional[str] = None, total_mode: str = "exact"):
+    engine = resolve_engine(db.bind.dialect.name)
+    ranked = bool(search and tokenize(search) and engine != "ilike")
+    after = None
+    if cursor:
+        after = decode_cursor(cursor, "rank", "id") if ranked else decode_cursor(cursor, "id")
+    if ranked:
+        if engine == "postgres":
+            books, total, next_key = await fulltext_search(db, search, page, per_page, after, total_mode)
+        else:
+            books, total, next_key = await inverted_search(db, search, page, per_page, after, total_mode)
+    else:
+        condition = true()
+        if search:
+            condition = or_(
                 models.Book.title.ilike(f"%{search}%"),
                 models.Book.author.ilike(f"%{search}%"),
                 models.Book.isbn.ilike(f"%{search}%")
             )
-        )
-    total = query.count()
-    books = query.offset((page - 1) * per_page).limit(per_page).all()
-    return {"books": books, "total": total, "page": page, "per_page": per_page}
+        query = select(models.Book).where(condition).order_by(models.Book.id)
+        if after is not None:
+            query = query.where(models.Book.id > after["id"])
+        else:
+            query = query.offset((page - 1) * per_page)
+        books = (await db.execute(query.limit(per_page + 1))).scalars().all()
+        next_key = None
+        if len(books) > per_page:
+            books = books[:per_page]
+            next_key = {"id": books[-1].id}
+        total = None
+        if total_mode == "estimate" and not search:
+            total = await estimate_book_count(db)
+        if total is None and total_mode != "none":
+            total = (await db.execute(select(func.count()).select_from(models.Book).where(condition))).scalar_one()
+    return {
+        "books": books,
+        "total": total,
+        "page": page,
+        "per_page": per_page,
+        "next_cursor": encode_cursor(next_key) if next_key else None
+    }
 
-def update_book(db: Session, book_id: int, book_data: schemas.BookUpdate):
-    db_book = get_book_by_id(db, book_id)
+async def update_book(db: AsyncSession, book_id: int, book_data: schemas.BookUpdate):
+    db_book = await get_book_by_id(db, book_id)
     if not db_book:
         return None
     for key, value in book_data.dict(exclude_unset=True).items():
         setattr(db_book, key, value)
     db_book.updated_at = func.now()
-    db.commit()
-    db.refresh(db_book)
+    await db.commit()
+    await db.refresh(db_book)
+    index_book(db_book)
     return db_book
 
-def update_book_availability(db: Session, book_id: int, availability_data: schemas.BookAvailabilityUpdate):
-    db_book = get_book_by_id(db, book_id)
-    if not db_book:
-        return None
-    if availability_data.operation == "increment":
-        db_book.available_copies += availability_data.available_copies
-    elif availability_data.operation == "decrement":
-        if db_book.available_copies < availability_data.available_copies:
-            raise HTTPException(status_code=400, detail="Not enough available copies")
-        db_book.available_copies -= availability_data.available_copies
+INVERSE_OPERATIONS = {"increment": "decrement", "decrement": "increment"}
+
+async def _apply_availability(db: AsyncSession, book_id: int, operation: str, copies: int):
+    if operation == "increment":
+        stmt = update(models.Book).where(models.Book.id == book_id).values(
+            available_copies=models.Book.available_copies + copies
+        )
+    elif operation == "decrement":
+        # Check and decrement in one conditional statement so concurrent checkouts cannot oversell
+        stmt = update(models.Book).where(
+            models.Book.id == book_id,
+            models.Book.available_copies >= copies
+        ).values(available_copies=models.Book.available_copies - copies)
     else:
         raise HTTPException(status_code=400, detail="Invalid operation")
-    db_book.updated_at = func.now()
-    db.commit()
-    db.refresh(db_book)
+    stmt = stmt.values(updated_at=func.now()).returning(models.Book).execution_options(synchronize_session=False)
+    return (await db.execute(stmt)).scalar_one_or_none()
+
+async def _processed_request(db: AsyncSession, key: str):
+    processed = await db.get(models.AvailabilityRequest, key)
+    if processed is None:
+        return None
+    created_at = processed.created_at
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    if created_at < datetime.now(timezone.utc) - AVAILABILITY_KEY_TTL:
+        # Expired but not purged yet: forget it so the key is treated as new
+        await db.delete(processed)
+        await db.flush()
+        return None
+    return processed
+
+async def purge_availability_requests(db: AsyncSession):
+    await db.execute(delete(models.AvailabilityRequest).where(
+        models.AvailabilityRequest.created_at < datetime.now(timezone.utc) - AVAILABILITY_KEY_TTL
+    ))
+    await db.commit()
+
+async def _replay_availability(db: AsyncSession, book_id: int, processed: models.AvailabilityRequest):
+    if processed.status == "REVOKED":
+        raise HTTPException(status_code=409, detail="Request was revoked")
+    return await get_book_by_id(db, book_id)
+
+async def update_book_availability(db: AsyncSession, book_id: int, availability_data: schemas.BookAvailabilityUpdate,
+                                   idempotency_key: Optional[str] = None, retry_on_conflict: bool = True):
+    if idempotency_key:
+        processed = await _processed_request(db, idempotency_key)
+        if processed:
+            return await _replay_availability(db, book_id, processed)
+
+    operation, copies = availability_data.operation, availability_data.available_copies
+    if availability_data.reverts:
+        original = await _processed_request(db, availability_data.reverts)
+        if original is None:
+            # The original never arrived (or is still in flight): revoke it so it is a no-op if it does
+            db.add(models.AvailabilityRequest(
+                idempotency_key=availability_data.reverts, book_id=book_id,
+                operation=operation, copies=copies, status="REVOKED"
+            ))
+            operation = None
+        elif original.status == "APPLIED":
+            operation, copies = INVERSE_OPERATIONS[original.operation], original.copies
+            original.status = "REVERTED"
+        else:
+            operation = None
+
+    if operation is None:
+        db_book = await get_book_by_id(db, book_id)
+    else:
+        db_book = await _apply_availability(db, book_id, operation, copies)
+        if db_book is None:
+            await db.rollback()
+            if operation == "decrement" and await get_book_by_id(db, book_id):
+                raise HTTPException(status_code=400, detail="Not enough available copies")
+            return None
+    if idempotency_key:
+        db.add(models.AvailabilityRequest(
+            idempotency_key=idempotency_key, book_id=book_id,
+            operation=operation or availability_data.operation, copies=copies
+        ))
+    try:
+        await db.commit()
+    except IntegrityError:
+        # A concurrent request with the same key won; re-run against what it committed
+        await db.rollback()
+        if not retry_on_conflict:
+            raise HTTPException(status_code=409, detail="Conflicting concurrent request")
+        return await update_book_availability(db, book_id, availability_data, idempotency_key, retry_on_conflict=False)
     return db_book
 
-def delete_book(db: Session, book_id: int):
-    db_book = get_book_by_id(db, book_id)
+async def delete_book(db: AsyncSession, book_id: int):
+    db_book = await get_book_by_id(db, book_id)
     if not db_book:
         return False
-    db.delete(db_book)
-    db.commit()
-    return True
\ No newline at end of file
+    await db.delete(db_book)
+    await db.commit()
+    unindex_book(book_id)
+    return True
@@ -0,0 +1,38 @@
+from fastapi import Response
+import hashlib
+import os
+
+# 0 means clients (and nginx) must revalidate every time; the ETag makes that a cheap 304
+BOOK_CACHE_MAX_AGE = int(os.getenv("BOOK_CACHE_MAX_AGE", "0"))
+# Search pages tolerate a few seconds of staleness; nginx's proxy_cache honours this too
+SEARCH_CACHE_MAX_AGE = int(os.getenv("SEARCH_CACHE_MAX_AGE", "5"))
+
+def cache_control(max_age: int) -> str:
+    return f"public, max-age={max_age}" if max_age > 0 else "no-cache"
+
+def _etag(*parts) -> str:
+    return '"' + hashlib.blake2b(repr(parts).encode(), digest_size=12).hexdigest() + '"'
+
+def book_version(book):
+    # updated_at versions the row on PostgreSQL; the other fields cover SQLite, whose CURRENT_TIMESTAMP
+    # has one-second resolution, so two writes in the same second still change the tag
+    return (book.id, book.updated_at or book.created_at, book.title, book.author, book.isbn,
+            book.copies, book.available_copies)
+
+def book_etag(book) -> str:
+    return _etag(*book_version(book))
+
+def search_etag(page) -> str:
+    return _etag([book_version(book) for book in page["books"]],
+                 page["total"], page["page"], page["per_page"], page["next_cursor"])
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    # If-None-Match uses the weak comparison: W/ prefixes are ignored
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+def not_modified(headers) -> Response:
+    return Response(status_code=304, headers=headers)
@@ -0,0 +1,39 @@
+# Shared module, copied into loan-service and book-service: edit loan-service's copy, then run benchmarks/check_shared_modules.py
+from app.tracing import SERVICE_NAME
+import asyncio
+import fcntl
+import logging
+import os
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+# gunicorn workers of one container share this file; whichever holds its lock runs the singleton jobs
+LEADER_LOCK_PATH = os.getenv("LEADER_LOCK_PATH", os.path.join(tempfile.gettempdir(), f"{SERVICE_NAME}-leader.lock"))
+LEADER_RETRY_INTERVAL = float(os.getenv("LEADER_RETRY_INTERVAL", "5"))
+
+_state = {"leader": False}
+
+def is_leader() -> bool:
+    return _state["leader"]
+
+async def run_as_leader(*jobs):
+    # jobs are coroutine functions; a follower keeps retrying so it takes over when the leader exits
+    with open(LEADER_LOCK_PATH, "a") as lock_file:
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                await asyncio.sleep(LEADER_RETRY_INTERVAL)
+        _state["leader"] = True
+        logger.info("Running background jobs in this worker", extra={"pid": os.getpid()})
+        tasks = [asyncio.create_task(job()) for job in jobs]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            _state["leader"] = False
+    # Closing the file releases the lock
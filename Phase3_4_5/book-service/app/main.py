@@ -1,12 +1,48 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from app.database import engine
-from app.models import Base
+from app.database import engine, SessionLocal
 from app.routers import router
+from app import instrumentation, log, tracing
+from app.crud import purge_availability_requests
+from app.leader import run_as_leader
+import asyncio
+import logging
 
-Base.metadata.create_all(bind=engine)
+logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Book Service")
+log.configure_logging()
+
+async def purge_periodically():
+    while True:
+        try:
+            async with SessionLocal() as db:
+                await purge_availability_requests(db)
+        except Exception:
+            logger.exception("Availability key purge failed")
+        await asyncio.sleep(3600)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One purger per container, not per worker
+    purger = asyncio.create_task(run_as_leader(purge_periodically))
+    exporter = asyncio.create_task(tracing.run_exporter())
+    flusher = asyncio.create_task(instrumentation.run_flusher())
+    yield
+    purger.cancel()
+    exporter.cancel()
+    flusher.cancel()
+    await asyncio.gather(purger, exporter, flusher, return_exceptions=True)
+    await engine.dispose()
+
+app = FastAPI(title="Book Service", lifespan=lifespan)
+
+instrumentation.instrument_engine(engine)
+tracing.instrument_engine(engine)
+app.add_middleware(instrumentation.MetricsMiddleware)
+app.add_middleware(tracing.TracingMiddleware)
+app.add_middleware(log.RequestLogMiddleware)
 
 # Configure CORS
 app.add_middleware(
@@ -22,4 +58,9 @@ app.add_middleware(
 async def health_check():
     return {"status": "healthy"}
 
+# Request latency and DB pool/query metrics in Prometheus text format
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return instrumentation.render_metrics()
+
 app.include_router(router)
\ No newline at end of file
@@ -11,4 +11,16 @@ class Book(Base):
     copies = Column(Integer, default=1)
     available_copies = Column(Integer, default=1)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
\ No newline at end of file
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+class AvailabilityRequest(Base):
+    # Idempotency-Key of every applied availability change, so redelivered requests are not applied twice
+    __tablename__ = "availability_requests"
+    idempotency_key = Column(String, primary_key=True)
+    book_id = Column(Integer, nullable=False)
+    operation = Column(String, nullable=False)
+    copies = Column(Integer, nullable=False)
+    # APPLIED, REVERTED (undone by a later request) or REVOKED (undone before it arrived)
+    status = Column(String, nullable=False, default="APPLIED")
+    # Keys expire AVAILABILITY_KEY_TTL_HOURS after this
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
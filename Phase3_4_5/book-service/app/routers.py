@@ -1,53 +1,117 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
-from typing import Optional
-from app import schemas, crud
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional, List
+from app import schemas, crud, bulk_import, http_cache
+from app.fast_json import FAST_JSON, FastJSONResponse, book_to_dict, search_page_to_dict
 from app.database import get_db
 
 router = APIRouter(prefix="/api/books", tags=["Books"])
 
+MAX_BATCH_IDS = 500
+
 @router.post("/", response_model=schemas.BookRead, status_code=201)
-def create_book(book: schemas.BookCreate, db: Session = Depends(get_db)):
+async def create_book(book: schemas.BookCreate, db: AsyncSession = Depends(get_db)):
     try:
-        return crud.create_book(db, book)
+        return await crud.create_book(db, book)
     except HTTPException as e:
         raise e
     except Exception:
         raise HTTPException(status_code=500, detail="Internal server error")
 
+@router.post("/import", response_model=schemas.BookImportResult)
+async def import_books(
+    request: Request,
+    format: Optional[str] = Query(None, pattern="^(csv|jsonl)$"),
+    db: AsyncSession = Depends(get_db)
+):
+    # The body is streamed and upserted in batches, never buffered whole
+    fmt = bulk_import.detect_format(request.headers.get("content-type"), format)
+    return await bulk_import.import_books(db, request.stream(), fmt)
+
 @router.get("/", response_model=schemas.BookSearchResponse)
-def search_books(
+async def search_books(
+    response: Response,
     search: Optional[str] = Query(None),
     page: int = Query(1, ge=1),
     per_page: int = Query(10, ge=1, le=100),
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page; takes precedence over page"),
+    total: str = Query("exact", pattern="^(exact|estimate|none)$"),
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db)
 ):
-    return crud.search_books(db, search, page, per_page)
+    result = await crud.search_books(db, search, page, per_page, cursor, total)
+    # The query still runs, but an unchanged page skips serialization and the response body
+    headers = {"ETag": http_cache.search_etag(result), "Cache-Control": http_cache.cache_control(http_cache.SEARCH_CACHE_MAX_AGE)}
+    if http_cache.etag_matches(if_none_match, headers["ETag"]):
+        return http_cache.not_modified(headers)
+    if FAST_JSON:
+        return FastJSONResponse(search_page_to_dict(result), headers=headers)
+    response.headers.update(headers)
+    return result
+
+@router.get("/batch", response_model=List[schemas.BookRead])
+async def get_books_batch(ids: str = Query(..., description="Comma-separated book IDs"), db: AsyncSession = Depends(get_db)):
+    try:
+        book_ids = sorted({int(i) for i in ids.split(",") if i.strip()})
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be comma-separated integers")
+    if len(book_ids) > MAX_BATCH_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_IDS} ids per request")
+    books = await crud.get_books_by_ids(db, book_ids)
+    if FAST_JSON:
+        return FastJSONResponse([book_to_dict(book) for book in books])
+    return books
+
+@router.get("/summary", response_model=schemas.BookInventorySummary)
+async def get_inventory_summary(db: AsyncSession = Depends(get_db)):
+    return await crud.get_inventory_summary(db)
 
 @router.get("/{book_id}", response_model=schemas.BookRead)
-def get_book(book_id: int, db: Session = Depends(get_db)):
-    db_book = crud.get_book_by_id(db, book_id)
+async def get_book(
+    book_id: int,
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db)
+):
+    cache_control = http_cache.cache_control(http_cache.BOOK_CACHE_MAX_AGE)
+    if if_none_match:
+        # Revalidation reads only the version columns and answers 304 without loading or serializing the book
+        version = await crud.get_book_version(db, book_id)
+        if version is not None:
+            etag = http_cache.book_etag(version)
+            if http_cache.etag_matches(if_none_match, etag):
+                return http_cache.not_modified({"ETag": etag, "Cache-Control": cache_control})
+    db_book = await crud.get_book_by_id(db, book_id)
     if not db_book:
         raise HTTPException(status_code=404, detail="Book not found")
+    headers = {"ETag": http_cache.book_etag(db_book), "Cache-Control": cache_control}
+    if FAST_JSON:
+        return FastJSONResponse(book_to_dict(db_book), headers=headers)
+    response.headers.update(headers)
     return db_book
 
 @router.put("/{book_id}", response_model=schemas.BookRead)
-def update_book(book_id: int, book_data: schemas.BookUpdate, db: Session = Depends(get_db)):
-    updated_book = crud.update_book(db, book_id, book_data)
+async def update_book(book_id: int, book_data: schemas.BookUpdate, db: AsyncSession = Depends(get_db)):
+    updated_book = await crud.update_book(db, book_id, book_data)
     if not updated_book:
         raise HTTPException(status_code=404, detail="Book not found")
     return updated_book
 
 @router.patch("/{book_id}/availability", response_model=schemas.BookRead)
-def update_availability(book_id: int, availability_data: schemas.BookAvailabilityUpdate, db: Session = Depends(get_db)):
-    updated_book = crud.update_book_availability(db, book_id, availability_data)
+async def update_availability(
+    book_id: int,
+    availability_data: schemas.BookAvailabilityUpdate,
+    idempotency_key: Optional[str] = Header(None, max_length=200),
+    db: AsyncSession = Depends(get_db)
+):
+    updated_book = await crud.update_book_availability(db, book_id, availability_data, idempotency_key)
     if not updated_book:
         raise HTTPException(status_code=404, detail="Book not found")
     return updated_book
 
 @router.delete("/{book_id}", status_code=204)
-def delete_book(book_id: int, db: Session = Depends(get_db)):
-    success = crud.delete_book(db, book_id)
+async def delete_book(book_id: int, db: AsyncSession = Depends(get_db)):
+    success = await crud.delete_book(db, book_id)
     if not success:
         raise HTTPException(status_code=404, detail="Book not found")
     return
\ No newline at end of file
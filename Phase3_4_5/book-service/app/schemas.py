@@ -30,10 +30,27 @@ class BookUpdate(BaseModel):
 
 class BookAvailabilityUpdate(BaseModel):
     available_copies: int
-    operation: str 
+    operation: str
+    # Idempotency-Key of an earlier update to undo; available_copies/operation are then ignored
+    reverts: Optional[str] = None
 
 class BookSearchResponse(BaseModel):
     books: List[BookRead]
-    total: int
+    total: Optional[int] = None
     page: int
-    per_page: int
\ No newline at end of file
+    per_page: int
+    next_cursor: Optional[str] = None
+
+class BookInventorySummary(BaseModel):
+    total_books: int
+    books_available: int
+
+class BookImportError(BaseModel):
+    row: int
+    isbn: Optional[str] = None
+    error: str
+
+class BookImportResult(BaseModel):
+    imported: int
+    failed: int
+    errors: List[BookImportError]
\ No newline at end of file
@@ -0,0 +1,177 @@
+from collections import defaultdict
+from bisect import bisect_left, bisect_right, insort
+from sqlalchemy import and_, func, literal_column, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app import models
+import asyncio
+import os
+import re
+import time
+
+# "auto" picks PostgreSQL full-text search when available and the in-process index otherwise
+SEARCH_ENGINE = os.getenv("SEARCH_ENGINE", "auto").lower()
+# The index is per process: writes made in other gunicorn workers or by the bulk import CLI show up
+# once it is rebuilt, so it is rebuilt when older than this (0 keeps it until cleared)
+INVERTED_INDEX_MAX_AGE = float(os.getenv("INVERTED_INDEX_MAX_AGE", "60"))
+
+# Must match the expression indexed by migration 0002 exactly, or the planner will not use the GIN index
+SEARCH_VECTOR = literal_column(
+    "to_tsvector('simple'::regconfig, coalesce(books.title, '') || ' ' || coalesce(books.author, ''))"
+)
+
+def tokenize(value: str):
+    return re.findall(r"\w+", (value or "").lower())
+
+def resolve_engine(dialect_name: str) -> str:
+    if SEARCH_ENGINE in ("postgres", "inverted", "ilike"):
+        return SEARCH_ENGINE
+    return "postgres" if dialect_name == "postgresql" else "inverted"
+
+class InvertedIndex:
+    # Token -> book id postings with prefix lookup, used where PostgreSQL text search is unavailable
+    def __init__(self):
+        self._postings = defaultdict(set)
+        self._terms = []
+        self._documents = {}
+        self.ready = False
+        self.loaded_at = 0.0
+
+    def fresh(self) -> bool:
+        return self.ready and (INVERTED_INDEX_MAX_AGE <= 0 or time.monotonic() - self.loaded_at < INVERTED_INDEX_MAX_AGE)
+
+    def replace(self, other: "InvertedIndex"):
+        # Swapped in one step, so searches in this worker never see a half-built index
+        self._postings, self._terms, self._documents = other._postings, other._terms, other._documents
+        self.loaded_at = time.monotonic()
+        self.ready = True
+
+    def _terms_for(self, book):
+        terms = set(tokenize(book.title)) | set(tokenize(book.author))
+        isbn = re.sub(r"[^0-9a-z]", "", (book.isbn or "").lower())
+        if isbn:
+            terms.add(isbn)
+        return terms
+
+    def add(self, book):
+        self.remove(book.id)
+        terms = self._terms_for(book)
+        self._documents[book.id] = terms
+        for term in terms:
+            if term not in self._postings:
+                insort(self._terms, term)
+            self._postings[term].add(book.id)
+
+    def remove(self, book_id: int):
+        for term in self._documents.pop(book_id, ()):
+            postings = self._postings[term]
+            postings.discard(book_id)
+            if not postings:
+                del self._postings[term]
+                self._terms.pop(bisect_left(self._terms, term))
+
+    def clear(self):
+        self._postings.clear()
+        self._terms.clear()
+        self._documents.clear()
+        self.ready = False
+
+    def _prefix_matches(self, prefix: str):
+        # Exact term hits score higher than prefix-only hits
+        matches = {}
+        i = bisect_left(self._terms, prefix)
+        while i < len(self._terms) and self._terms[i].startswith(prefix):
+            term = self._terms[i]
+            weight = 2.0 if term == prefix else 1.0
+            for book_id in self._postings[term]:
+                matches[book_id] = max(matches.get(book_id, 0.0), weight)
+            i += 1
+        return matches
+
+    def search(self, query: str):
+        scores = None
+        for token in tokenize(query):
+            matches = self._prefix_matches(token)
+            if scores is None:
+                scores = matches
+            else:
+                scores = {book_id: scores[book_id] + weight for book_id, weight in matches.items() if book_id in scores}
+            if not scores:
+                return []
+        return sorted((scores or {}).items(), key=lambda item: (-item[1], item[0]))
+
+inverted_index = InvertedIndex()
+_loading = asyncio.Lock()
+
+async def load_inverted_index(db: AsyncSession):
+    async with _loading:
+        # Another request may have rebuilt it while this one waited
+        if inverted_index.fresh():
+            return
+        index = InvertedIndex()
+        result = await db.stream(select(models.Book.id, models.Book.title, models.Book.author, models.Book.isbn))
+        async for row in result:
+            index.add(row)
+        inverted_index.replace(index)
+
+def index_book(book):
+    if inverted_index.ready:
+        inverted_index.add(book)
+
+def unindex_book(book_id: int):
+    if inverted_index.ready:
+        inverted_index.remove(book_id)
+
+def build_tsquery(search: str) -> str:
+    # Prefix-match every word so partial titles ("harr pott") still hit the GIN index
+    return " & ".join(f"{token}:*" for token in tokenize(search))
+
+async def fulltext_search(db: AsyncSession, search: str, page: int, per_page: int, after: dict = None, total_mode: str = "exact"):
+    tsquery = func.to_tsquery(literal_column("'simple'::regconfig"), build_tsquery(search))
+    pattern = f"%{search}%"
+    rank = func.ts_rank_cd(SEARCH_VECTOR, tsquery) + func.similarity(models.Book.title, search)
+    condition = or_(
+        SEARCH_VECTOR.op("@@")(tsquery),
+        models.Book.isbn.ilike(pattern),
+        models.Book.title.op("%")(search)
+    )
+    query = select(models.Book, rank.label("rank")).where(condition)
+    # On the first page count(*) OVER () returns the match total without a second scan
+    windowed = total_mode != "none" and after is None
+    if windowed:
+        query = query.add_columns(func.count().over().label("total"))
+    if after is not None:
+        query = query.where(or_(rank < after["rank"], and_(rank == after["rank"], models.Book.id > after["id"])))
+    else:
+        query = query.offset((page - 1) * per_page)
+    rows = (await db.execute(query.order_by(rank.desc(), models.Book.id).limit(per_page + 1))).all()
+    next_key = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_key = {"rank": float(rows[-1].rank), "id": rows[-1].Book.id}
+    total = None
+    if windowed and rows:
+        total = rows[0].total
+    elif total_mode != "none":
+        total = (await db.execute(select(func.count()).select_from(models.Book).where(condition))).scalar_one()
+    return [row.Book for row in rows], total, next_key
+
+async def inverted_search(db: AsyncSession, search: str, page: int, per_page: int, after: dict = None, total_mode: str = "exact"):
+    # While another request rebuilds a stale index, keep answering from the old one
+    if not inverted_index.fresh() and not (inverted_index.ready and _loading.locked()):
+        await load_inverted_index(db)
+    ranked = inverted_index.search(search)
+    if after is not None:
+        start = bisect_right(ranked, (-after["rank"], after["id"]), key=lambda item: (-item[1], item[0]))
+    else:
+        start = (page - 1) * per_page
+    window = ranked[start:start + per_page + 1]
+    next_key = None
+    if len(window) > per_page:
+        window = window[:per_page]
+        next_key = {"rank": window[-1][1], "id": window[-1][0]}
+    total = len(ranked) if total_mode != "none" else None
+    page_ids = [book_id for book_id, _ in window]
+    if not page_ids:
+        return [], total, None
+    books = {b.id: b for b in (await db.execute(select(models.Book).where(models.Book.id.in_(page_ids)))).scalars()}
+    return [books[book_id] for book_id in page_ids if book_id in books], total, next_key
@@ -0,0 +1,41 @@
+"""Initial books schema
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0001"
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Databases bootstrapped by the old import-time create_all already have the table
+    if not op.get_context().as_sql and sa.inspect(op.get_bind()).has_table("books"):
+        return
+    op.create_table(
+        "books",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("title", sa.String(), nullable=False),
+        sa.Column("author", sa.String(), nullable=False),
+        sa.Column("isbn", sa.String(), nullable=False, unique=True),
+        sa.Column("copies", sa.Integer()),
+        sa.Column("available_copies", sa.Integer()),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("updated_at", sa.DateTime(timezone=True)),
+    )
+    op.create_index("ix_books_id", "books", ["id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_books_id", table_name="books")
+    op.drop_table("books")
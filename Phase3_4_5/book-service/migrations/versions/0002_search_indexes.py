@@ -0,0 +1,40 @@
+"""Full-text and trigram search indexes
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0002"
+down_revision: Union[str, None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # SQLite runs use the in-process inverted index in app.search instead
+    if op.get_bind().dialect.name != "postgresql":
+        return
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    with op.get_context().autocommit_block():
+        # The expression must match app.search.SEARCH_VECTOR for the planner to use it
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_books_search_vector ON books USING gin "
+            "(to_tsvector('simple'::regconfig, coalesce(title, '') || ' ' || coalesce(author, '')))"
+        )
+        op.execute("CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_books_title_trgm ON books USING gin (title gin_trgm_ops)")
+        op.execute("CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_books_isbn_trgm ON books USING gin (isbn gin_trgm_ops)")
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != "postgresql":
+        return
+    op.execute("DROP INDEX IF EXISTS ix_books_isbn_trgm")
+    op.execute("DROP INDEX IF EXISTS ix_books_title_trgm")
+    op.execute("DROP INDEX IF EXISTS ix_books_search_vector")
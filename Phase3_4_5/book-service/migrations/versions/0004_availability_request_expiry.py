@@ -0,0 +1,25 @@
+"""Index availability_requests by age for key expiry
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0004"
+down_revision: Union[str, None] = "0003"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index("ix_availability_requests_created_at", "availability_requests", ["created_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_availability_requests_created_at", table_name="availability_requests")
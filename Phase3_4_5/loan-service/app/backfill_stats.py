@@ -0,0 +1,73 @@
+from sqlalchemy import select
+from app import models
+from app.database import SessionLocal, engine
+from app.outbox import STATS_SERVICE_URL, stats_headers
+import argparse
+import asyncio
+import httpx
+import json
+import sys
+
+# One-off: stats-service only learns about loans from outbox events, so on an existing database it starts
+# empty. This replays every confirmed loan as loan_created (and loan_returned) events.
+#
+#   docker compose exec loan-service python -m app.backfill_stats
+#
+# Run it once, against a stats-service that has not applied any events yet: backfilled events carry the
+# loan's issue/return time, not the outbox's enqueue time, so they would not dedupe against live ones.
+
+BACKFILL_BATCH_SIZE = 1000
+
+def loan_events(loan: models.Loan):
+    base = {"loan_id": loan.id, "user_id": loan.user_id, "book_id": loan.book_id,
+            "due_date": loan.due_date.isoformat() if loan.due_date else None}
+    yield {**base, "type": "loan_created", "occurred_at": loan.issue_date.isoformat()}
+    if loan.return_date is not None:
+        yield {**base, "type": "loan_returned", "occurred_at": loan.return_date.isoformat()}
+
+async def backfill(client: httpx.AsyncClient, concurrency: int):
+    sent = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def send(event):
+        async with semaphore:
+            response = await client.post(f"{STATS_SERVICE_URL}/api/stats/events", json=event, headers=stats_headers())
+            response.raise_for_status()
+
+    after_id = 0
+    while True:
+        async with SessionLocal() as db:
+            loans = (await db.execute(
+                select(models.Loan)
+                .where(models.Loan.id > after_id, models.Loan.status.in_(["ACTIVE", "RETURNED"]))
+                .order_by(models.Loan.id)
+                .limit(BACKFILL_BATCH_SIZE)
+            )).scalars().all()
+        if not loans:
+            return sent
+        # Per batch, created events go out before returned ones so a return never precedes its loan
+        events = [e for loan in loans for e in loan_events(loan)]
+        for event_type in ("loan_created", "loan_returned"):
+            batch = [e for e in events if e["type"] == event_type]
+            await asyncio.gather(*(send(e) for e in batch))
+            sent += len(batch)
+        after_id = loans[-1].id
+
+async def main():
+    parser = argparse.ArgumentParser(description="Replay existing loans into stats-service")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--force", action="store_true", help="Run even if stats-service already has events")
+    args = parser.parse_args()
+
+    async with httpx.AsyncClient(timeout=10.0) as client:
+        applied = (await client.get(f"{STATS_SERVICE_URL}/metrics/aggregator")).json()["events_applied"]
+        if applied and not args.force:
+            print(f"stats-service has already applied {applied} events; backfilling would double count. "
+                  "Start it with an empty snapshot, or pass --force.", file=sys.stderr)
+            sys.exit(1)
+        sent = await backfill(client, args.concurrency)
+    await engine.dispose()
+    print(json.dumps({"events_sent": sent}, indent=2))
+
+if __name__ == "__main__":
+    asyncio.run(main())
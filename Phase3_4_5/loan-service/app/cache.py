@@ -0,0 +1,78 @@
+from collections import OrderedDict
+import os
+import time
+
+class TTLCache:
+    # Bounded LRU cache whose entries also expire after a fixed TTL
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+user_cache = TTLCache(
+    maxsize=int(os.getenv("USER_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("USER_CACHE_TTL", "300")),
+)
+book_cache = TTLCache(
+    maxsize=int(os.getenv("BOOK_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("BOOK_CACHE_TTL", "60")),
+)
+
+def invalidate_user(user_id: int):
+    user_cache.invalidate(user_id)
+
+def invalidate_book(book_id: int):
+    book_cache.invalidate(book_id)
+
+def refresh_book(book: dict):
+    book_cache.set(book["id"], book)
+
+def cache_stats():
+    return {"users": user_cache.stats(), "books": book_cache.stats()}
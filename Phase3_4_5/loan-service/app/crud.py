@@ -1,126 +1,266 @@
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, select
 from datetime import datetime, timedelta, timezone
-from app import models, schemas
+from app import models, schemas, cache
+from app import outbox, resilience
+from app.idempotency import IdempotentRequest
+from sqlalchemy.exc import IntegrityError
+from app.pagination import encode_cursor, decode_cursor
 from fastapi import HTTPException
 import httpx
 import os
-from tenacity import retry, stop_after_attempt, wait_fixed, retry_if_exception_type
+from typing import List, Optional
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
 
 USER_SERVICE_URL = os.getenv("USER_SERVICE_URL", "http://user-service:5000")
 BOOK_SERVICE_URL = os.getenv("BOOK_SERVICE_URL", "http://book-service:5002")
+# Matches the batch endpoints' id limit in user-service and book-service
+BATCH_SIZE = 500
+LOAN_DETAILS_DEADLINE = float(os.getenv("LOAN_DETAILS_DEADLINE", "3.0"))
+
+def _unavailable(service: str, error):
+    logger.warning("Dependency call failed", extra={"dependency": service, "error": f"{type(error).__name__}: {error}"})
+    if isinstance(error, resilience.CircuitOpenError):
+        return HTTPException(
+            status_code=503, detail=f"{service} unavailable",
+            headers={"Retry-After": str(max(1, round(error.retry_after)))}
+        )
+    return HTTPException(status_code=503, detail=f"{service} unavailable")
 
-@retry(stop=stop_after_attempt(3), wait=wait_fixed(1), retry=retry_if_exception_type(httpx.RequestError))
 async def get_user(client: httpx.AsyncClient, user_id: int):
+    user = cache.user_cache.get(user_id)
+    if user is not None:
+        return user
     try:
-        response = await client.get(f"{USER_SERVICE_URL}/api/users/{user_id}")
-        if response.status_code == 404:
-            raise HTTPException(status_code=404, detail="User not found")
-        response.raise_for_status()
-        return response.json()
-    except httpx.HTTPStatusError as e:
-        print(f"User service error: {str(e)}")
-        raise HTTPException(status_code=503, detail=f"User Service unavailable: {str(e)}")
-    except httpx.RequestError as e:
-        print(f"User service connection error: {str(e)}")
-        raise HTTPException(status_code=503, detail=f"User Service connection error: {str(e)}")
-    except Exception as e:
-        print(f"Unexpected error when calling user service: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
-
-@retry(stop=stop_after_attempt(3), wait=wait_fixed(1), retry=retry_if_exception_type(httpx.RequestError))
-async def get_book(client: httpx.AsyncClient, book_id: int):
-    try:
-        url = f"{BOOK_SERVICE_URL}/api/books/{book_id}"
-        print(f"Requesting book from: {url}")
-        response = await client.get(url)
-        if response.status_code == 404:
-            print(f"Book not found at {url}. Response: {response.text}")
-            raise HTTPException(status_code=404, detail="Book not found")
-        response.raise_for_status()
-        return response.json()
-    except httpx.HTTPStatusError as e:
-        if e.response.status_code == 404:
-            raise HTTPException(status_code=404, detail="Book not found")
-        raise HTTPException(status_code=503, detail="Book Service unavailable")
-    except httpx.RequestError:
-        raise HTTPException(status_code=503, detail="Book Service unavailable")
-
-@retry(stop=stop_after_attempt(3), wait=wait_fixed(1), retry=retry_if_exception_type(httpx.RequestError))
-async def update_book_availability(client: httpx.AsyncClient, book_id: int, operation: str, copies: int = 1):
-    try:
-        response = await client.patch(
-            f"{BOOK_SERVICE_URL}/api/books/{book_id}/availability",
-            json={"available_copies": copies, "operation": operation}
+        response = await resilience.user_service.request(
+            client, "GET", f"{USER_SERVICE_URL}/api/users/{user_id}", route="get_user"
         )
-        response.raise_for_status()
-        return response.json()
-    except httpx.HTTPStatusError as e:
-        if e.response.status_code == 404:
-            raise HTTPException(status_code=404, detail="Book not found")
-        if e.response.status_code == 400:
-            raise HTTPException(status_code=400, detail="Not enough available copies")
-        raise HTTPException(status_code=503, detail="Book Service unavailable")
-    except httpx.RequestError:
-        raise HTTPException(status_code=503, detail="Book Service unavailable")
-
-async def create_loan(db: Session, loan_data: schemas.LoanCreate):
-    async with httpx.AsyncClient(timeout=5.0) as client:
-
-        await get_user(client, loan_data.user_id)
-
-        book = await get_book(client, loan_data.book_id)
-        if book["available_copies"] < 1:
-            raise HTTPException(status_code=400, detail="Book not available")
-
-        await update_book_availability(client, loan_data.book_id, "decrement")
-
-        loan = models.Loan(
-            user_id=loan_data.user_id,
-            book_id=loan_data.book_id,
-            issue_date=datetime.now(timezone.utc),
-            due_date=loan_data.due_date,
-            status="ACTIVE",
-            extensions_count=0
+    except (httpx.HTTPError, resilience.CircuitOpenError) as e:
+        raise _unavailable("User Service", e)
+    if response.status_code == 404:
+        raise HTTPException(status_code=404, detail="User not found")
+    if response.is_error:
+        raise _unavailable("User Service", response.status_code)
+    user = response.json()
+    cache.user_cache.set(user_id, user)
+    return user
+
+async def get_book(client: httpx.AsyncClient, book_id: int, fresh: bool = False):
+    if not fresh:
+        book = cache.book_cache.get(book_id)
+        if book is not None:
+            return book
+    try:
+        response = await resilience.book_service.request(
+            client, "GET", f"{BOOK_SERVICE_URL}/api/books/{book_id}", route="get_book"
         )
-        db.add(loan)
-        db.commit()
-        db.refresh(loan)
-        return loan
+    except (httpx.HTTPError, resilience.CircuitOpenError) as e:
+        raise _unavailable("Book Service", e)
+    if response.status_code == 404:
+        cache.invalidate_book(book_id)
+        raise HTTPException(status_code=404, detail="Book not found")
+    if response.is_error:
+        raise _unavailable("Book Service", response.status_code)
+    book = response.json()
+    cache.refresh_book(book)
+    return book
+
+async def get_books(client: httpx.AsyncClient, book_ids: List[int], strict: bool = True):
+    books = {}
+    unique_ids = sorted(set(book_ids))
+    missing_ids = []
+    for book_id in unique_ids:
+        book = cache.book_cache.get(book_id)
+        if book is None:
+            missing_ids.append(book_id)
+        else:
+            books[book_id] = book
+    for start in range(0, len(missing_ids), BATCH_SIZE):
+        chunk = missing_ids[start:start + BATCH_SIZE]
+        try:
+            response = await resilience.book_service.request(
+                client, "GET", f"{BOOK_SERVICE_URL}/api/books/batch", route="get_books",
+                params={"ids": ",".join(str(i) for i in chunk)}
+            )
+        except (httpx.HTTPError, resilience.CircuitOpenError) as e:
+            raise _unavailable("Book Service", e)
+        if response.is_error:
+            raise _unavailable("Book Service", response.status_code)
+        for book in response.json():
+            books[book["id"]] = book
+            cache.refresh_book(book)
+    if strict and len(books) != len(unique_ids):
+        raise HTTPException(status_code=404, detail="Book not found")
+    return books
 
-async def return_loan(db: Session, loan_id: int):
-    loan = db.query(models.Loan).filter(
+async def get_users(client: httpx.AsyncClient, user_ids: List[int]):
+    # Users that no longer exist are simply absent from the result
+    users = {}
+    missing_ids = []
+    for user_id in sorted(set(user_ids)):
+        user = cache.user_cache.get(user_id)
+        if user is None:
+            missing_ids.append(user_id)
+        else:
+            users[user_id] = user
+    for start in range(0, len(missing_ids), BATCH_SIZE):
+        chunk = missing_ids[start:start + BATCH_SIZE]
+        try:
+            response = await resilience.user_service.request(
+                client, "GET", f"{USER_SERVICE_URL}/api/users/batch", route="get_users",
+                params={"ids": ",".join(str(i) for i in chunk)}
+            )
+        except (httpx.HTTPError, resilience.CircuitOpenError) as e:
+            raise _unavailable("User Service", e)
+        if response.is_error:
+            raise _unavailable("User Service", response.status_code)
+        for user in response.json():
+            users[user["id"]] = user
+            cache.user_cache.set(user["id"], user)
+    return users
+
+async def _commit_idempotent(db: AsyncSession, idempotent: Optional[IdempotentRequest]):
+    try:
+        await db.commit()
+    except IntegrityError:
+        # A concurrent retry with the same key committed first: undo ours and replay its response
+        await db.rollback()
+        replay = await idempotent.replay(db) if idempotent else None
+        if replay is None:
+            raise
+        return replay
+    return None
+
+async def create_loan(db: AsyncSession, client: httpx.AsyncClient, loan_data: schemas.LoanCreate,
+                      idempotent: Optional[IdempotentRequest] = None):
+    await get_user(client, loan_data.user_id)
+
+    # Pre-check only; book-service's conditional decrement is the real guard. The cached copy can be
+    # up to the TTL old and miss returns handled elsewhere, so "none left" is confirmed with a fresh read
+    book = await get_book(client, loan_data.book_id)
+    if book["available_copies"] < 1:
+        book = await get_book(client, loan_data.book_id, fresh=True)
+    if book["available_copies"] < 1:
+        raise HTTPException(status_code=400, detail="Book not available")
+
+    # The loan and its decrement request commit together; the outbox dispatcher confirms or cancels it
+    loan = models.Loan(
+        user_id=loan_data.user_id,
+        book_id=loan_data.book_id,
+        issue_date=datetime.now(timezone.utc),
+        due_date=loan_data.due_date,
+        status="PENDING",
+        extensions_count=0
+    )
+    db.add(loan)
+    await db.flush()
+    outbox.enqueue_availability(db, loan, "decrement")
+    if idempotent:
+        idempotent.remember(db, 201, schemas.Loan.model_validate(loan, from_attributes=True).model_dump(mode="json"))
+    replay = await _commit_idempotent(db, idempotent)
+    if replay:
+        return replay
+    await db.refresh(loan)
+    outbox.notify()
+    return loan
+
+async def return_loan(db: AsyncSession, client: httpx.AsyncClient, loan_id: int,
+                      idempotent: Optional[IdempotentRequest] = None):
+    loan = (await db.execute(select(models.Loan).where(
         models.Loan.id == loan_id,
-        models.Loan.status != "RETURNED"
-    ).first()
+        models.Loan.status == "ACTIVE"
+    ))).scalars().first()
     if not loan:
         raise HTTPException(status_code=404, detail="Loan not found or already returned")
-    async with httpx.AsyncClient(timeout=5.0) as client:
-        
-        await update_book_availability(client, loan.book_id, "increment")
-        
-        loan.return_date = datetime.now(timezone.utc)
-        loan.status = "RETURNED"
-        db.commit()
-        db.refresh(loan)
-        return loan
-
-def get_loan_by_id(db: Session, loan_id: int):
-    return db.query(models.Loan).filter(models.Loan.id == loan_id).first()
-
-async def get_loan_details(db: Session, loan_id: int):
-    loan = get_loan_by_id(db, loan_id)
+
+    loan.return_date = datetime.now(timezone.utc)
+    loan.status = "RETURNED"
+    outbox.enqueue_availability(db, loan, "increment")
+    outbox.enqueue_loan_event(db, "loan_returned", loan)
+    if idempotent:
+        idempotent.remember(db, 200, schemas.Loan.model_validate(loan, from_attributes=True).model_dump(mode="json"))
+    replay = await _commit_idempotent(db, idempotent)
+    if replay:
+        return replay
+    await db.refresh(loan)
+    outbox.notify()
+    return loan
+
+async def get_loan_by_id(db: AsyncSession, loan_id: int):
+    return await db.get(models.Loan, loan_id)
+
+async def _timed(timings: dict, name: str, coro):
+    start = time.perf_counter()
+    try:
+        return await coro
+    finally:
+        timings[name] = (time.perf_counter() - start) * 1000
+
+async def get_loan_details(db: AsyncSession, client: httpx.AsyncClient, loan_id: int, timings: Optional[dict] = None):
+    loan = await get_loan_by_id(db, loan_id)
     if not loan:
         raise HTTPException(status_code=404, detail="Loan not found")
-    async with httpx.AsyncClient(timeout=5.0) as client:
-        user = await get_user(client, loan.user_id)
-        book = await get_book(client, loan.book_id)
-        return {
+    if timings is None:
+        timings = {}
+    try:
+        user, book = await asyncio.wait_for(
+            asyncio.gather(
+                _timed(timings, "user-service", get_user(client, loan.user_id)),
+                _timed(timings, "book-service", get_book(client, loan.book_id))
+            ),
+            timeout=LOAN_DETAILS_DEADLINE
+        )
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Upstream services timed out")
+    return {
+        "id": loan.id,
+        "user": {
+            "id": user["id"],
+            "name": user["name"],
+            "email": user["email"]
+        },
+        "book": {
+            "id": book["id"],
+            "title": book["title"],
+            "author": book["author"]
+        },
+        "issue_date": loan.issue_date,
+        "due_date": loan.due_date,
+        "return_date": loan.return_date,
+        "status": loan.status
+    }
+
+async def get_loan_history(db: AsyncSession, user_id: int, limit: Optional[int] = None, after_id: Optional[int] = None):
+    query = select(models.Loan).where(models.Loan.user_id == user_id).order_by(models.Loan.id)
+    if after_id is not None:
+        query = query.where(models.Loan.id > after_id)
+    if limit is not None:
+        query = query.limit(limit)
+    return (await db.execute(query)).scalars().all()
+
+async def count_loan_history(db: AsyncSession, user_id: int):
+    return (await db.execute(
+        select(func.count()).select_from(models.Loan).where(models.Loan.user_id == user_id)
+    )).scalar_one()
+
+async def get_loan_history_details(db: AsyncSession, client: httpx.AsyncClient, user_id: int,
+                                   limit: Optional[int] = None, cursor: Optional[str] = None, total_mode: str = "exact"):
+    after_id = decode_cursor(cursor, "id")["id"] if cursor else None
+    loans = await get_loan_history(db, user_id, limit + 1 if limit else None, after_id)
+    next_cursor = None
+    if limit and len(loans) > limit:
+        loans = loans[:limit]
+        next_cursor = encode_cursor({"id": loans[-1].id})
+    books = await get_books(client, [loan.book_id for loan in loans]) if loans else {}
+    results = []
+    for loan in loans:
+        book = books[loan.book_id]
+        results.append({
             "id": loan.id,
-            "user": {
-                "id": user["id"],
-                "name": user["name"],
-                "email": user["email"]
-            },
             "book": {
                 "id": book["id"],
                 "title": book["title"],
@@ -130,33 +270,15 @@ async def get_loan_details(db: Session, loan_id: int):
             "due_date": loan.due_date,
             "return_date": loan.return_date,
             "status": loan.status
-        }
-
-def get_loan_history(db: Session, user_id: int):
-    return db.query(models.Loan).filter(models.Loan.user_id == user_id).all()
-
-async def get_loan_history_details(db: Session, user_id: int):
-    loans = get_loan_history(db, user_id)
-    async with httpx.AsyncClient(timeout=5.0) as client:
-        results = []
-        for loan in loans:
-            book = await get_book(client, loan.book_id)
-            results.append({
-                "id": loan.id,
-                "book": {
-                    "id": book["id"],
-                    "title": book["title"],
-                    "author": book["author"]
-                },
-                "issue_date": loan.issue_date,
-                "due_date": loan.due_date,
-                "return_date": loan.return_date,
-                "status": loan.status
-            })
-        return {"loans": results, "total": len(results)}
-
-def extend_loan_due_date(db: Session, loan_id: int, days: int):
-    loan = db.query(models.Loan).filter(models.Loan.id == loan_id).first()
+        })
+    total = None
+    if total_mode != "none":
+        # The unpaginated history is the whole set, so its length is the total
+        total = len(results) if limit is None and after_id is None else await count_loan_history(db, user_id)
+    return {"loans": results, "total": total, "next_cursor": next_cursor}
+
+async def extend_loan_due_date(db: AsyncSession, loan_id: int, days: int):
+    loan = await get_loan_by_id(db, loan_id)
     if not loan:
         raise HTTPException(status_code=404, detail="Loan not found")
     if loan.status != "ACTIVE":
@@ -166,8 +288,10 @@ def extend_loan_due_date(db: Session, loan_id: int, days: int):
     original_due = loan.due_date
     loan.due_date += timedelta(days=days)
     loan.extensions_count += 1
-    db.commit()
-    db.refresh(loan)
+    outbox.enqueue_loan_event(db, "loan_extended", loan)
+    await db.commit()
+    await db.refresh(loan)
+    outbox.notify()
     return {
         "id": loan.id,
         "user_id": loan.user_id,
@@ -177,4 +301,4 @@ def extend_loan_due_date(db: Session, loan_id: int, days: int):
         "extended_due_date": loan.due_date,
         "status": loan.status,
         "extensions_count": loan.extensions_count
-    }
\ No newline at end of file
+    }
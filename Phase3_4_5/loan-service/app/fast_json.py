@@ -0,0 +1,11 @@
+from fastapi.responses import ORJSONResponse
+import orjson
+import os
+
+# Opt-in: hot reads skip response_model validation and encode with orjson
+FAST_JSON = os.getenv("FAST_JSON", "false").lower() in ("1", "true", "yes")
+
+class FastJSONResponse(ORJSONResponse):
+    def render(self, content) -> bytes:
+        # OPT_UTC_Z writes UTC datetimes as "...Z", the same as Pydantic, so both modes return identical JSON
+        return orjson.dumps(content, option=orjson.OPT_UTC_Z)
@@ -0,0 +1,98 @@
+from fastapi import Request
+import httpx
+from app import instrumentation, log, tracing
+import os
+
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "5.0"))
+HTTP_POOL_TIMEOUT = float(os.getenv("HTTP_POOL_TIMEOUT", "2.0"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30.0"))
+
+class _ReleasingStream(httpx.AsyncByteStream):
+    # Marks the call finished once its body has been read or the response is closed
+    def __init__(self, stream, release):
+        self._stream = stream
+        self._release = release
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            self._release()
+
+class CountingTransport(httpx.AsyncBaseTransport):
+    # Wraps the pooled transport through httpx's public transport API to track calls in flight
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self.transport = transport
+        self.requests_total = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.requests_total += 1
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            response = await self.transport.handle_async_request(request)
+        except BaseException:
+            self.in_flight -= 1
+            raise
+        released = False
+
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                self.in_flight -= 1
+
+        response.stream = _ReleasingStream(response.stream, release)
+        return response
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+_transport = None
+
+def create_http_client() -> httpx.AsyncClient:
+    global _transport
+    # One client per process so connections to user-service and book-service are reused
+    metrics_hooks = instrumentation.httpx_event_hooks()
+    trace_hooks = tracing.httpx_event_hooks()
+    log_hooks = log.httpx_event_hooks()
+    pool = httpx.AsyncHTTPTransport(limits=httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    ))
+    _transport = CountingTransport(pool)
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(HTTP_TIMEOUT, pool=HTTP_POOL_TIMEOUT),
+        transport=_transport,
+        event_hooks={
+            "request": [*metrics_hooks["request"], *trace_hooks["request"], *log_hooks["request"]],
+            "response": [*metrics_hooks["response"], *trace_hooks["response"]],
+        },
+    )
+
+def get_http_client(request: Request) -> httpx.AsyncClient:
+    return request.app.state.http_client
+
+def pool_stats():
+    # Derived from calls in flight: the pool's own connection list is not public API
+    transport = _transport
+    in_flight = transport.in_flight if transport else 0
+    return {
+        "max_connections": HTTP_MAX_CONNECTIONS,
+        "max_keepalive_connections": HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        "in_flight_requests": in_flight,
+        "peak_in_flight_requests": transport.peak_in_flight if transport else 0,
+        # Calls beyond max_connections wait for a connection (up to HTTP_POOL_TIMEOUT)
+        "queued_requests": max(0, in_flight - HTTP_MAX_CONNECTIONS),
+        "utilization": round(min(in_flight, HTTP_MAX_CONNECTIONS) / HTTP_MAX_CONNECTIONS, 4) if HTTP_MAX_CONNECTIONS else 0.0,
+        "requests_total": transport.requests_total if transport else 0,
+    }
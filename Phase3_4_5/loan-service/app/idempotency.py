@@ -0,0 +1,71 @@
+from datetime import datetime, timedelta, timezone
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from pydantic import BaseModel
+from typing import Optional
+from app import models
+from app.database import SessionLocal
+import asyncio
+import hashlib
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_TTL = timedelta(hours=float(os.getenv("IDEMPOTENCY_TTL_HOURS", "24")))
+IDEMPOTENCY_PURGE_INTERVAL = 3600
+
+def _now():
+    return datetime.now(timezone.utc)
+
+class IdempotentRequest:
+    # One Idempotency-Key for one operation; the stored response is written in the operation's own transaction
+    def __init__(self, key: str, scope: str, body: BaseModel):
+        self.key = key
+        self.scope = scope
+        # Only a digest of the request is kept, enough to reject a key reused for a different request
+        self.request_hash = hashlib.sha256(
+            json.dumps(body.model_dump(mode="json"), sort_keys=True).encode()
+        ).hexdigest()
+
+    async def replay(self, db: AsyncSession) -> Optional[JSONResponse]:
+        stored = await db.get(models.IdempotencyKey, self.key)
+        if stored is None:
+            return None
+        expires_at = stored.expires_at if stored.expires_at.tzinfo else stored.expires_at.replace(tzinfo=timezone.utc)
+        if expires_at <= _now():
+            await db.delete(stored)
+            await db.flush()
+            return None
+        if stored.scope != self.scope or stored.request_hash != self.request_hash:
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+        return JSONResponse(status_code=stored.status_code, content=stored.response, headers={"Idempotent-Replayed": "true"})
+
+    def remember(self, db: AsyncSession, status_code: int, response: dict):
+        db.add(models.IdempotencyKey(
+            key=self.key,
+            scope=self.scope,
+            request_hash=self.request_hash,
+            status_code=status_code,
+            response=response,
+            expires_at=_now() + IDEMPOTENCY_TTL
+        ))
+
+def idempotent_request(key: Optional[str], scope: str, body: BaseModel) -> Optional[IdempotentRequest]:
+    return IdempotentRequest(key, scope, body) if key else None
+
+async def purge_expired(db: AsyncSession):
+    await db.execute(delete(models.IdempotencyKey).where(models.IdempotencyKey.expires_at < _now()))
+    await db.commit()
+
+async def purge_periodically():
+    while True:
+        try:
+            async with SessionLocal() as db:
+                await purge_expired(db)
+        except Exception:
+            logger.exception("Idempotency key purge failed")
+        await asyncio.sleep(IDEMPOTENCY_PURGE_INTERVAL)
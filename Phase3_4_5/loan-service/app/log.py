@@ -0,0 +1,180 @@
+# Shared module, copied into every service: edit loan-service's copy, then run benchmarks/check_shared_modules.py
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from app.tracing import SERVICE_NAME, current_span
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import time
+import uuid
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Level for third-party loggers (aiosqlite, httpcore, asyncio) that would otherwise flood DEBUG
+LOG_LIBRARY_LEVEL = os.getenv("LOG_LIBRARY_LEVEL", "WARNING").upper()
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "0.01"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_SLOW_REQUEST_MS = float(os.getenv("LOG_SLOW_REQUEST_MS", "1000"))
+
+REQUEST_ID_HEADER = "X-Request-ID"
+
+request_id = ContextVar("request_id", default=None)
+logger = logging.getLogger("app.requests")
+
+# Attributes every LogRecord has; anything else came in through extra= and is logged as a field
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "request_id", "trace_id"}
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "service": SERVICE_NAME,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        if getattr(record, "trace_id", None):
+            entry["trace_id"] = record.trace_id
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+class ContextFilter(logging.Filter):
+    # Runs on the calling task, where the request and trace contextvars are still set
+    def filter(self, record):
+        record.request_id = request_id.get()
+        span = current_span()
+        record.trace_id = span.trace_id if span else None
+        return True
+
+class DebugSamplingFilter(logging.Filter):
+    # Keeps a fraction of DEBUG records so per-request debug logging stays affordable in production
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno > logging.DEBUG or self.rate >= 1 or random.random() < self.rate
+
+class DroppingQueueHandler(QueueHandler):
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        # Never block the event loop on a slow stdout; shed records instead
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record):
+        # Resolve args and tracebacks while they are still valid, leave JSON encoding to the listener thread
+        record = copy.copy(record)
+        record.msg, record.args = record.getMessage(), None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+_handler = None
+_stream = None
+_listener = None
+
+def _start_listener():
+    global _listener
+    _handler.queue = queue.Queue(LOG_QUEUE_SIZE)
+    _listener = QueueListener(_handler.queue, _stream, respect_handler_level=True)
+    _listener.start()
+
+def _stop_listener():
+    if _listener is not None:
+        _listener.stop()
+
+def configure_logging():
+    global _handler, _stream
+    if _handler is not None:
+        return
+    _stream = logging.StreamHandler(sys.stdout)
+    _stream.setFormatter(JsonFormatter())
+    handler = _handler = DroppingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+    handler.addFilter(DebugSamplingFilter(LOG_DEBUG_SAMPLE_RATE))
+    handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(LOG_LIBRARY_LEVEL)
+    logging.getLogger("app").setLevel(LOG_LEVEL)
+    # Route uvicorn's own loggers through the queue; its per-request access log is replaced by RequestLogMiddleware
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers = []
+        uvicorn_logger.propagate = True
+    logging.getLogger("uvicorn.access").setLevel(logging.WARNING)
+
+    _start_listener()
+    atexit.register(_stop_listener)
+    # Threads do not survive fork: a preloaded gunicorn worker needs its own queue and listener
+    os.register_at_fork(after_in_child=_start_listener)
+
+class RequestLogMiddleware:
+    # Pure ASGI: assigns the request id, echoes it back, and logs completion (sampled unless slow or failed)
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        incoming = None
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                incoming = value.decode("latin-1")[:200]
+                break
+        rid = incoming or uuid.uuid4().hex
+        token = request_id.set(rid)
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                message = {**message, "headers": [*message.get("headers", []), (b"x-request-id", rid.encode())]}
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration_ms = round((time.perf_counter() - start) * 1000, 2)
+            level = logging.DEBUG
+            if status[0] >= 500:
+                level = logging.ERROR
+            elif duration_ms >= LOG_SLOW_REQUEST_MS:
+                level = logging.WARNING
+            if logger.isEnabledFor(level):
+                logger.log(level, "request completed", extra={
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "status": status[0],
+                    "duration_ms": duration_ms,
+                })
+            request_id.reset(token)
+
+async def _forward_request_id(request):
+    rid = request_id.get()
+    if rid and REQUEST_ID_HEADER not in request.headers:
+        request.headers[REQUEST_ID_HEADER] = rid
+
+def httpx_event_hooks():
+    return {"request": [_forward_request_id], "response": []}
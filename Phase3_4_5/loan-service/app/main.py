@@ -1,12 +1,48 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from app.database import engine
-from app.models import Base
+from app.database import engine, SessionLocal
 from app.routers import router
+from app.http_client import create_http_client, pool_stats
+from app.cache import cache_stats
+from app import instrumentation, log, tracing
+from app.outbox import run_dispatcher, outbox_stats
+from app.overdue import run_scanner, scanner_stats
+from app.idempotency import purge_periodically
+from app.leader import run_as_leader, is_leader
+import asyncio
 
-Base.metadata.create_all(bind=engine)
+log.configure_logging()
 
-app = FastAPI(title="Loan Service")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.http_client = create_http_client()
+    # Every worker drains the outbox (SKIP LOCKED) so its own commits are sent without waiting for a poll
+    dispatcher = asyncio.create_task(run_dispatcher(app.state.http_client))
+    # The purge and the overdue scan only need to run once per container
+    singletons = asyncio.create_task(run_as_leader(purge_periodically, lambda: run_scanner(app.state.http_client)))
+    exporter = asyncio.create_task(tracing.run_exporter())
+    flusher = asyncio.create_task(instrumentation.run_flusher())
+    yield
+    singletons.cancel()
+    dispatcher.cancel()
+    exporter.cancel()
+    # Let them unwind (roll back, finish the current send) before the client and engine close
+    await asyncio.gather(singletons, dispatcher, exporter, return_exceptions=True)
+    # Last, so the final metrics include the work the tasks above finished
+    flusher.cancel()
+    await asyncio.gather(flusher, return_exceptions=True)
+    await app.state.http_client.aclose()
+    await engine.dispose()
+
+app = FastAPI(title="Loan Service", lifespan=lifespan)
+
+instrumentation.instrument_engine(engine)
+tracing.instrument_engine(engine)
+app.add_middleware(instrumentation.MetricsMiddleware)
+app.add_middleware(tracing.TracingMiddleware)
+app.add_middleware(log.RequestLogMiddleware)
 
 # Configure CORS
 app.add_middleware(
@@ -22,4 +58,31 @@ app.add_middleware(
 async def health_check():
     return {"status": "healthy"}
 
-app.include_router(router)
\ No newline at end of file
+# Outbound connection pool utilization
+@app.get("/metrics/http-pool")
+async def http_pool_metrics():
+    return pool_stats()
+
+# User/book lookup cache hit, miss and eviction counters
+@app.get("/metrics/cache")
+async def lookup_cache_metrics():
+    return cache_stats()
+
+# Request, DB and outbound call metrics plus circuit breaker state, in Prometheus text format
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return instrumentation.render_metrics()
+
+# Outbox backlog: pending, delivered and dead-lettered messages
+@app.get("/metrics/outbox")
+async def outbox_metrics():
+    async with SessionLocal() as db:
+        return await outbox_stats(db)
+
+# Overdue scanner: snapshot size, age and scan duration
+@app.get("/metrics/overdue")
+async def overdue_metrics():
+    # Only the leader worker scans; the others serve live pages
+    return {**scanner_stats(), "leader": is_leader()}
+
+app.include_router(router)
@@ -1,11 +1,14 @@
-from sqlalchemy import Column, Integer, DateTime, Enum, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, Enum, ForeignKey, Index, JSON, text
 from sqlalchemy.sql import func
 from app.database import Base
 import enum
 
 class LoanStatus(enum.Enum):
+    # PENDING until book-service confirms the copy; CANCELLED if it cannot
+    PENDING = "PENDING"
     ACTIVE = "ACTIVE"
     RETURNED = "RETURNED"
+    CANCELLED = "CANCELLED"
 
 class Loan(Base):
     __tablename__ = "loans"
@@ -16,4 +19,48 @@ class Loan(Base):
     due_date = Column(DateTime, nullable=False)
     return_date = Column(DateTime, nullable=True)
     status = Column(Enum(LoanStatus), default=LoanStatus.ACTIVE)
-    extensions_count = Column(Integer, default=0)
\ No newline at end of file
+    extensions_count = Column(Integer, default=0)
+
+    # Created by migration 0002; declared here so autogenerate sees them
+    __table_args__ = (
+        Index("ix_loans_user_id_id", "user_id", "id"),
+        Index("ix_loans_book_id", "book_id"),
+        Index(
+            "ix_loans_active_due_date", "due_date", "id",
+            postgresql_where=text("status = 'ACTIVE'"),
+            sqlite_where=text("status = 'ACTIVE'")
+        ),
+    )
+
+class OutboxMessage(Base):
+    # Written in the same transaction as the loan change; app.outbox delivers it afterwards
+    __tablename__ = "outbox"
+    id = Column(Integer, primary_key=True)
+    topic = Column(String, nullable=False)
+    loan_id = Column(Integer, nullable=True)
+    idempotency_key = Column(String, unique=True, nullable=False)
+    payload = Column(JSON, nullable=False)
+    status = Column(String, nullable=False, default="PENDING")
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime(timezone=True), nullable=False)
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    sent_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        Index(
+            "ix_outbox_pending", "next_attempt_at", "id",
+            postgresql_where=text("status = 'PENDING'"),
+            sqlite_where=text("status = 'PENDING'")
+        ),
+    )
+
+class IdempotencyKey(Base):
+    # Responses of POST requests sent with an Idempotency-Key, replayed on retries until expires_at
+    __tablename__ = "idempotency_keys"
+    key = Column(String, primary_key=True)
+    scope = Column(String, nullable=False)
+    request_hash = Column(String, nullable=False)
+    status_code = Column(Integer, nullable=False)
+    response = Column(JSON, nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
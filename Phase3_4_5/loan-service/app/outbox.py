@@ -0,0 +1,227 @@
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app import models, cache, resilience, tracing
+from app.database import SessionLocal
+import asyncio
+import httpx
+import logging
+import os
+import random
+
+logger = logging.getLogger(__name__)
+
+BOOK_SERVICE_URL = os.getenv("BOOK_SERVICE_URL", "http://book-service:5002")
+STATS_SERVICE_URL = os.getenv("STATS_SERVICE_URL", "http://stats-service:5003")
+STATS_EVENTS_TOKEN = os.getenv("STATS_EVENTS_TOKEN")
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "100"))
+OUTBOX_CONCURRENCY = int(os.getenv("OUTBOX_CONCURRENCY", "10"))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "1.0"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_MAX_BACKOFF = float(os.getenv("OUTBOX_MAX_BACKOFF", "300"))
+OUTBOX_RETENTION = timedelta(hours=float(os.getenv("OUTBOX_RETENTION_HOURS", "24")))
+
+BOOK_AVAILABILITY = "book.availability"
+STATS_EVENT = "stats.event"
+
+_wakeup = asyncio.Event()
+
+class PermanentFailure(Exception):
+    # The downstream service definitively rejected the message; retrying cannot help
+    pass
+
+def _now():
+    return datetime.now(timezone.utc)
+
+def notify():
+    # Called after a commit that added messages, so delivery does not wait for the next poll
+    _wakeup.set()
+
+def enqueue(db: AsyncSession, topic: str, idempotency_key: str, payload: dict, loan_id: int = None,
+            traceparent: str = None):
+    # Carry the trace of the request that caused the message, so delivery shows up in the same trace
+    traceparent = traceparent or tracing.current_traceparent()
+    if traceparent:
+        payload = {**payload, "traceparent": traceparent}
+    db.add(models.OutboxMessage(
+        topic=topic,
+        loan_id=loan_id,
+        idempotency_key=idempotency_key,
+        payload=payload,
+        status="PENDING",
+        attempts=0,
+        next_attempt_at=_now()
+    ))
+
+def enqueue_availability(db: AsyncSession, loan: models.Loan, operation: str, reverts: str = None,
+                         traceparent: str = None):
+    name = "revert" if reverts else operation
+    payload = {"book_id": loan.book_id, "operation": operation, "copies": 1}
+    if reverts:
+        payload["reverts"] = reverts
+    enqueue(db, BOOK_AVAILABILITY, f"loan-{loan.id}-{name}", payload, loan.id, traceparent)
+
+def enqueue_loan_event(db: AsyncSession, event_type: str, loan: models.Loan, traceparent: str = None):
+    occurred_at = _now().isoformat()
+    enqueue(db, STATS_EVENT, f"loan-{loan.id}-{event_type}-{occurred_at}", {
+        "type": event_type,
+        "loan_id": loan.id,
+        "user_id": loan.user_id,
+        "book_id": loan.book_id,
+        "due_date": loan.due_date.isoformat() if loan.due_date else None,
+        "occurred_at": occurred_at,
+    }, loan.id, traceparent)
+
+async def _send_availability(client: httpx.AsyncClient, message: models.OutboxMessage):
+    payload = message.payload
+    body = {"available_copies": payload["copies"], "operation": payload["operation"]}
+    if payload.get("reverts"):
+        body["reverts"] = payload["reverts"]
+    # The outbox has its own backoff, so no in-call retries; the breaker still short-circuits a sick service
+    response = await resilience.book_service.request(
+        client, "PATCH", f"{BOOK_SERVICE_URL}/api/books/{payload['book_id']}/availability",
+        route="update_availability", retry=False,
+        json=body, headers={"Idempotency-Key": message.idempotency_key}
+    )
+    if response.status_code in (400, 404, 409):
+        cache.invalidate_book(payload["book_id"])
+        raise PermanentFailure(f"{response.status_code}: {response.text}")
+    response.raise_for_status()
+    cache.refresh_book(response.json())
+
+def stats_headers():
+    return {"X-Stats-Token": STATS_EVENTS_TOKEN} if STATS_EVENTS_TOKEN else {}
+
+async def _send_stats_event(client: httpx.AsyncClient, message: models.OutboxMessage):
+    response = await resilience.stats_service.request(
+        client, "POST", f"{STATS_SERVICE_URL}/api/stats/events", route="events", retry=False,
+        json={key: value for key, value in message.payload.items() if key != "traceparent"},
+        headers=stats_headers()
+    )
+    if 400 <= response.status_code < 500 and response.status_code != 429:
+        raise PermanentFailure(f"{response.status_code}: {response.text}")
+    response.raise_for_status()
+
+SENDERS = {BOOK_AVAILABILITY: _send_availability, STATS_EVENT: _send_stats_event}
+
+async def _on_sent(db: AsyncSession, message: models.OutboxMessage):
+    payload = message.payload
+    if message.topic == BOOK_AVAILABILITY and payload["operation"] == "decrement" and not payload.get("reverts"):
+        loan = await db.get(models.Loan, message.loan_id)
+        if loan and loan.status == models.LoanStatus.PENDING:
+            loan.status = models.LoanStatus.ACTIVE
+            enqueue_loan_event(db, "loan_created", loan, payload.get("traceparent"))
+
+async def _on_failed(db: AsyncSession, message: models.OutboxMessage, permanent: bool):
+    payload = message.payload
+    logger.error("Outbox message failed", extra={
+        "idempotency_key": message.idempotency_key,
+        "attempts": message.attempts,
+        "error": message.last_error,
+        "permanent": permanent,
+    })
+    if message.topic == BOOK_AVAILABILITY and payload["operation"] == "decrement" and not payload.get("reverts"):
+        loan = await db.get(models.Loan, message.loan_id)
+        if loan and loan.status == models.LoanStatus.PENDING:
+            loan.status = models.LoanStatus.CANCELLED
+            if not permanent:
+                # The decrement may have landed before the connection failed: revert it either way
+                enqueue_availability(db, loan, "increment", reverts=message.idempotency_key,
+                                     traceparent=payload.get("traceparent"))
+
+def _backoff(attempts: int) -> timedelta:
+    return timedelta(seconds=min(OUTBOX_MAX_BACKOFF, 2 ** attempts) * random.uniform(0.5, 1.0))
+
+async def dispatch_batch(client: httpx.AsyncClient) -> int:
+    async with SessionLocal() as db:
+        # SKIP LOCKED lets several loan-service processes drain the outbox without double-sending
+        messages = (await db.execute(
+            select(models.OutboxMessage)
+            .where(models.OutboxMessage.status == "PENDING", models.OutboxMessage.next_attempt_at <= _now())
+            .order_by(models.OutboxMessage.id)
+            .limit(OUTBOX_BATCH_SIZE)
+            .with_for_update(skip_locked=True)
+        )).scalars().all()
+        if not messages:
+            await db.rollback()
+            return 0
+
+        semaphore = asyncio.Semaphore(OUTBOX_CONCURRENCY)
+
+        async def attempt(message):
+            async with semaphore:
+                with tracing.span(f"outbox {message.topic}", parent=message.payload.get("traceparent"),
+                                  idempotency_key=message.idempotency_key, attempt=message.attempts + 1) as delivery:
+                    try:
+                        await SENDERS[message.topic](client, message)
+                        return None, False
+                    except PermanentFailure as e:
+                        delivery.set_error(e)
+                        return str(e), True
+                    except (httpx.HTTPError, resilience.CircuitOpenError) as e:
+                        delivery.set_error(e)
+                        return f"{type(e).__name__}: {e}", False
+
+        results = await asyncio.gather(*(attempt(m) for m in messages))
+        for message, (error, permanent) in zip(messages, results):
+            message.attempts += 1
+            if error is None:
+                message.status = "SENT"
+                message.sent_at = _now()
+                message.last_error = None
+                await _on_sent(db, message)
+                continue
+            message.last_error = error[:500]
+            # Compensations keep retrying: giving up on one would leak a copy
+            gives_up = permanent or (message.attempts >= OUTBOX_MAX_ATTEMPTS and not message.payload.get("reverts"))
+            if gives_up:
+                message.status = "FAILED"
+                await _on_failed(db, message, permanent)
+            else:
+                message.next_attempt_at = _now() + _backoff(message.attempts)
+        await db.commit()
+    return len(messages)
+
+async def purge_sent(db: AsyncSession):
+    # Delivered messages are only kept for inspection; FAILED ones stay until handled
+    await db.execute(delete(models.OutboxMessage).where(
+        models.OutboxMessage.status == "SENT",
+        models.OutboxMessage.sent_at < _now() - OUTBOX_RETENTION
+    ))
+    await db.commit()
+
+async def run_dispatcher(client: httpx.AsyncClient):
+    last_purge = _now()
+    while True:
+        _wakeup.clear()
+        try:
+            if _now() - last_purge > timedelta(hours=1):
+                async with SessionLocal() as db:
+                    await purge_sent(db)
+                last_purge = _now()
+            processed = await dispatch_batch(client)
+        except Exception:
+            logger.exception("Outbox dispatch error")
+            processed = 0
+        if processed >= OUTBOX_BATCH_SIZE:
+            continue
+        if processed:
+            notify()
+        try:
+            await asyncio.wait_for(_wakeup.wait(), OUTBOX_POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+async def outbox_stats(db: AsyncSession):
+    counts = dict((await db.execute(
+        select(models.OutboxMessage.status, func.count()).group_by(models.OutboxMessage.status)
+    )).all())
+    oldest = (await db.execute(
+        select(func.min(models.OutboxMessage.created_at)).where(models.OutboxMessage.status == "PENDING")
+    )).scalar()
+    return {
+        "pending": counts.get("PENDING", 0),
+        "sent": counts.get("SENT", 0),
+        "failed": counts.get("FAILED", 0),
+        "oldest_pending": oldest,
+    }
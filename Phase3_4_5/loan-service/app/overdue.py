@@ -0,0 +1,165 @@
+from bisect import bisect_right
+from datetime import datetime, timezone
+from fastapi import HTTPException
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional, Tuple
+from app import crud, models
+from app.database import SessionLocal
+from app.pagination import encode_cursor, decode_cursor
+import asyncio
+import httpx
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+OVERDUE_SCANNER = os.getenv("OVERDUE_SCANNER", "true").lower() in ("1", "true", "yes")
+OVERDUE_SCAN_INTERVAL = float(os.getenv("OVERDUE_SCAN_INTERVAL", "60"))
+# Older snapshots are not served; the endpoint falls back to a live query
+OVERDUE_MAX_STALENESS = float(os.getenv("OVERDUE_MAX_STALENESS", str(3 * OVERDUE_SCAN_INTERVAL)))
+OVERDUE_CHUNK_SIZE = int(os.getenv("OVERDUE_CHUNK_SIZE", "500"))
+
+def naive_utcnow():
+    # due_date is stored without a timezone, as UTC
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+async def get_overdue_chunk(db: AsyncSession, now: datetime, limit: int,
+                            after: Optional[Tuple[datetime, int]] = None):
+    # Keyset on (due_date, id): served by the partial ix_loans_active_due_date index, no OFFSET scans
+    query = select(models.Loan).where(
+        models.Loan.status == "ACTIVE",
+        models.Loan.due_date < now
+    ).order_by(models.Loan.due_date, models.Loan.id).limit(limit)
+    if after is not None:
+        query = query.where(tuple_(models.Loan.due_date, models.Loan.id) > tuple_(*after))
+    return (await db.execute(query)).scalars().all()
+
+async def iter_overdue_loans(db: AsyncSession, now: datetime, chunk_size: int = OVERDUE_CHUNK_SIZE):
+    after = None
+    while True:
+        loans = await get_overdue_chunk(db, now, chunk_size, after)
+        if not loans:
+            return
+        yield loans
+        if len(loans) < chunk_size:
+            return
+        after = (loans[-1].due_date, loans[-1].id)
+
+async def enrich_overdue(client: httpx.AsyncClient, loans, now: datetime):
+    # One batched user lookup and one batched book lookup per chunk, instead of two calls per loan
+    users, books = await asyncio.gather(
+        crud.get_users(client, [loan.user_id for loan in loans]),
+        crud.get_books(client, [loan.book_id for loan in loans], strict=False)
+    )
+    results = []
+    for loan in loans:
+        user = users.get(loan.user_id)
+        book = books.get(loan.book_id)
+        results.append({
+            "id": loan.id,
+            "user": {"id": user["id"], "name": user["name"], "email": user["email"]} if user else None,
+            "book": {"id": book["id"], "title": book["title"], "author": book["author"]} if book else None,
+            "issue_date": loan.issue_date,
+            "due_date": loan.due_date,
+            "days_overdue": (now - loan.due_date).days,
+        })
+    return results
+
+async def get_overdue_page(db: AsyncSession, client: httpx.AsyncClient, limit: int,
+                           after: Optional[Tuple[datetime, int]] = None):
+    now = naive_utcnow()
+    loans = await get_overdue_chunk(db, now, limit + 1, after)
+    next_cursor = None
+    if len(loans) > limit:
+        loans = loans[:limit]
+        next_cursor = encode_cursor({"due_date": loans[-1].due_date.isoformat(), "id": loans[-1].id})
+    return {
+        "loans": await enrich_overdue(client, loans, now) if loans else [],
+        "total": None,
+        "next_cursor": next_cursor,
+        "generated_at": now.replace(tzinfo=timezone.utc),
+        "source": "live",
+    }
+
+class OverdueSnapshot:
+    def __init__(self, loans, generated_at: datetime, duration: float):
+        # Sorted by (due_date, id), the same order and cursor as the live query
+        self.loans = loans
+        self.keys = [(loan["due_date"], loan["id"]) for loan in loans]
+        self.generated_at = generated_at
+        self.scanned_at = time.monotonic()
+        self.duration = duration
+
+    def age(self) -> float:
+        return time.monotonic() - self.scanned_at
+
+    def page(self, limit: int, after=None):
+        start = bisect_right(self.keys, after) if after else 0
+        loans = self.loans[start:start + limit]
+        next_cursor = None
+        if start + limit < len(self.loans):
+            next_cursor = encode_cursor({"due_date": loans[-1]["due_date"].isoformat(), "id": loans[-1]["id"]})
+        return loans, next_cursor
+
+_snapshot = None
+_scans = {"completed": 0, "failed": 0}
+
+async def scan(client: httpx.AsyncClient) -> OverdueSnapshot:
+    global _snapshot
+    start = time.perf_counter()
+    now = naive_utcnow()
+    # Read every chunk first so the connection is not held while the user and book lookups run
+    async with SessionLocal() as db:
+        chunks = [chunk async for chunk in iter_overdue_loans(db, now)]
+    loans = []
+    for chunk in chunks:
+        loans.extend(await enrich_overdue(client, chunk, now))
+    _snapshot = OverdueSnapshot(loans, now, time.perf_counter() - start)
+    _scans["completed"] += 1
+    return _snapshot
+
+async def run_scanner(client: httpx.AsyncClient):
+    if not OVERDUE_SCANNER:
+        return
+    while True:
+        try:
+            await scan(client)
+        except Exception:
+            _scans["failed"] += 1
+            logger.exception("Overdue scan failed")
+        await asyncio.sleep(OVERDUE_SCAN_INTERVAL)
+
+def _parse_cursor(cursor: str):
+    key = decode_cursor(cursor, "due_date", "id")
+    try:
+        return datetime.fromisoformat(key["due_date"]), int(key["id"])
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+async def get_overdue(db, client: httpx.AsyncClient, limit: int, cursor: str = None, live: bool = False):
+    # Served from the scanner's snapshot when it is fresh enough; otherwise one keyset page from the database
+    snapshot = _snapshot
+    if live or snapshot is None or snapshot.age() > OVERDUE_MAX_STALENESS:
+        return await get_overdue_page(db, client, limit, _parse_cursor(cursor) if cursor else None)
+    loans, next_cursor = snapshot.page(limit, _parse_cursor(cursor) if cursor else None)
+    now = naive_utcnow()
+    return {
+        # days_overdue moves with the clock, so recompute it rather than serve the scan-time value
+        "loans": [{**loan, "days_overdue": (now - loan["due_date"]).days} for loan in loans],
+        "total": len(snapshot.loans),
+        "next_cursor": next_cursor,
+        "generated_at": snapshot.generated_at.replace(tzinfo=timezone.utc),
+        "source": "snapshot",
+    }
+
+def scanner_stats():
+    snapshot = _snapshot
+    return {
+        **_scans,
+        "interval": OVERDUE_SCAN_INTERVAL,
+        "overdue_loans": len(snapshot.loans) if snapshot else None,
+        "age_seconds": round(snapshot.age(), 3) if snapshot else None,
+        "scan_seconds": round(snapshot.duration, 3) if snapshot else None,
+    }
@@ -0,0 +1,17 @@
+from fastapi import HTTPException
+import base64
+import json
+
+# Cursors are opaque to clients: URL-safe base64 of the last row's sort key
+def encode_cursor(key: dict) -> str:
+    raw = json.dumps(key, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str, *fields: str) -> dict:
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(key, dict) or any(field not in key for field in fields):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return key
@@ -0,0 +1,225 @@
+from app import tracing
+from app.instrumentation import Counter, Gauge, registry
+import asyncio
+import httpx
+import os
+import random
+import time
+
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_TIMEOUT = float(os.getenv("BREAKER_RESET_TIMEOUT", "15"))
+BREAKER_HALF_OPEN_CALLS = int(os.getenv("BREAKER_HALF_OPEN_CALLS", "1"))
+ADAPTIVE_TIMEOUT_MIN = float(os.getenv("ADAPTIVE_TIMEOUT_MIN", "0.2"))
+ADAPTIVE_TIMEOUT_MAX = float(os.getenv("ADAPTIVE_TIMEOUT_MAX", os.getenv("HTTP_TIMEOUT", "5.0")))
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "3"))
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "0.05"))
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "1.0"))
+RETRY_DEADLINE = float(os.getenv("RETRY_DEADLINE", "2.0"))
+RETRY_BUDGET_RATIO = float(os.getenv("RETRY_BUDGET_RATIO", "0.2"))
+RETRY_BUDGET_MIN_TOKENS = float(os.getenv("RETRY_BUDGET_MIN_TOKENS", "10"))
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+class CircuitOpenError(Exception):
+    def __init__(self, dependency: str, retry_after: float):
+        super().__init__(f"{dependency} circuit is open")
+        self.dependency = dependency
+        self.retry_after = retry_after
+
+class CircuitBreaker:
+    # Opens after consecutive failures, then lets a few probe calls through once the reset timeout passes
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 reset_timeout: float = BREAKER_RESET_TIMEOUT, half_open_calls: int = BREAKER_HALF_OPEN_CALLS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_calls = half_open_calls
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probes = 0
+        self.transitions = 0
+
+    def _set_state(self, state: str):
+        if state != self.state:
+            self.state = state
+            self.transitions += 1
+
+    def before_call(self):
+        if self.state == OPEN:
+            waited = time.monotonic() - self.opened_at
+            if waited < self.reset_timeout:
+                raise CircuitOpenError(self.name, self.reset_timeout - waited)
+            self._set_state(HALF_OPEN)
+            self.probes = 0
+        if self.state == HALF_OPEN:
+            if self.probes >= self.half_open_calls:
+                raise CircuitOpenError(self.name, self.reset_timeout)
+            self.probes += 1
+
+    def release_probe(self):
+        # A probe that was cancelled proved nothing; let another caller probe instead
+        if self.state == HALF_OPEN and self.probes > 0:
+            self.probes -= 1
+
+    def record_success(self):
+        self.failures = 0
+        self._set_state(CLOSED)
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            self._set_state(OPEN)
+
+class AdaptiveTimeout:
+    # TCP-style RTO: smoothed latency plus four deviations, clamped to [minimum, maximum]
+    def __init__(self, minimum: float = ADAPTIVE_TIMEOUT_MIN, maximum: float = ADAPTIVE_TIMEOUT_MAX,
+                 alpha: float = 0.125, beta: float = 0.25):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.alpha = alpha
+        self.beta = beta
+        self.latency = None
+        self.deviation = 0.0
+
+    def observe(self, seconds: float):
+        if self.latency is None:
+            self.latency = seconds
+            self.deviation = seconds / 2
+            return
+        self.deviation = (1 - self.beta) * self.deviation + self.beta * abs(seconds - self.latency)
+        self.latency = (1 - self.alpha) * self.latency + self.alpha * seconds
+
+    def current(self) -> float:
+        if self.latency is None:
+            return self.maximum
+        return min(self.maximum, max(self.minimum, self.latency + 4 * self.deviation))
+
+class RetryBudget:
+    # Every request deposits a fraction of a token and every retry spends one, so retries stay a bounded share of traffic
+    def __init__(self, ratio: float = RETRY_BUDGET_RATIO, min_tokens: float = RETRY_BUDGET_MIN_TOKENS):
+        self.ratio = ratio
+        self.max_tokens = min_tokens
+        self.tokens = min_tokens
+
+    def deposit(self):
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+def backoff_delay(attempt: int) -> float:
+    # Full jitter: spreads retries from many callers instead of synchronizing them
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+class Dependency:
+    def __init__(self, name: str):
+        self.name = name
+        self.breaker = CircuitBreaker(name)
+        # Per route, since a 500-id batch lookup is legitimately slower than a single get
+        self.timeouts = {}
+        self.budget = RetryBudget()
+        self.requests = {"success": 0, "failure": 0, "short_circuited": 0}
+        self.retries = 0
+        self.retries_denied = 0
+
+    def timeout_for(self, route: str) -> AdaptiveTimeout:
+        if route not in self.timeouts:
+            self.timeouts[route] = AdaptiveTimeout()
+        return self.timeouts[route]
+
+    async def request(self, client: httpx.AsyncClient, method: str, url: str, route: str = "default",
+                      retry: bool = True, **kwargs) -> httpx.Response:
+        # One span for the whole call; each attempt gets its own client span from the httpx hooks
+        with tracing.span(f"{self.name} {route}", dependency=self.name, route=route) as call_span:
+            response = await self._request(client, method, url, route, retry, call_span, **kwargs)
+            call_span.set_tag("http.status_code", response.status_code)
+            return response
+
+    async def _request(self, client: httpx.AsyncClient, method: str, url: str, route: str,
+                       retry: bool, call_span: tracing.Span, **kwargs) -> httpx.Response:
+        # Returns any response below 500; transport errors and 5xx count against the breaker and are retried
+        adaptive = self.timeout_for(route)
+        self.budget.deposit()
+        deadline = time.monotonic() + RETRY_DEADLINE
+        attempt = 0
+        while True:
+            try:
+                self.breaker.before_call()
+            except CircuitOpenError:
+                self.requests["short_circuited"] += 1
+                raise
+            timeout = adaptive.current()
+            call_span.set_tag("attempts", attempt + 1)
+            call_span.set_tag("timeout", round(timeout, 3))
+            start = time.monotonic()
+            try:
+                response = await client.request(method, url, timeout=timeout, **kwargs)
+                if response.status_code >= 500:
+                    response.raise_for_status()
+            except asyncio.CancelledError:
+                self.breaker.release_probe()
+                raise
+            except httpx.HTTPError as e:
+                elapsed = time.monotonic() - start
+                # A timeout says the dependency got slower, so let the estimate grow
+                adaptive.observe(elapsed if not isinstance(e, httpx.TimeoutException) else timeout * 2)
+                self.breaker.record_failure()
+                self.requests["failure"] += 1
+                attempt += 1
+                delay = backoff_delay(attempt)
+                if not retry or attempt >= RETRY_MAX_ATTEMPTS or time.monotonic() + delay > deadline:
+                    raise
+                if not self.budget.withdraw():
+                    self.retries_denied += 1
+                    raise
+                self.retries += 1
+                await asyncio.sleep(delay)
+                continue
+            adaptive.observe(time.monotonic() - start)
+            self.breaker.record_success()
+            self.requests["success"] += 1
+            return response
+
+user_service = Dependency("user-service")
+book_service = Dependency("book-service")
+stats_service = Dependency("stats-service")
+DEPENDENCIES = (user_service, book_service, stats_service)
+
+def _per_dependency(value):
+    return lambda: {(dep.name,): value(dep) for dep in DEPENDENCIES}
+
+def _per_route(value):
+    return lambda: {(dep.name, route): value(adaptive) for dep in DEPENDENCIES for route, adaptive in dep.timeouts.items()}
+
+# Registered with the service metrics so they are merged across workers like the rest
+registry.register(Counter(
+    "loan_dependency_requests_total", "Outbound calls by dependency and outcome", ("dependency", "outcome"),
+    function=lambda: {(dep.name, outcome): count for dep in DEPENDENCIES for outcome, count in dep.requests.items()}))
+registry.register(Counter(
+    "loan_dependency_retries_total", "Retries performed", ("dependency",),
+    function=_per_dependency(lambda d: d.retries)))
+registry.register(Counter(
+    "loan_dependency_retries_denied_total", "Retries refused by the retry budget", ("dependency",),
+    function=_per_dependency(lambda d: d.retries_denied)))
+# Each worker has its own breaker; the worst state is the one worth alerting on
+registry.register(Gauge(
+    "loan_dependency_circuit_state", "Circuit state: 0 closed, 1 half-open, 2 open", ("dependency",),
+    function=_per_dependency(lambda d: STATE_VALUES[d.breaker.state]), multiprocess_mode="max"))
+registry.register(Counter(
+    "loan_dependency_circuit_transitions_total", "Circuit state changes", ("dependency",),
+    function=_per_dependency(lambda d: d.breaker.transitions)))
+registry.register(Gauge(
+    "loan_dependency_retry_budget_tokens", "Retries currently affordable", ("dependency",),
+    function=_per_dependency(lambda d: round(d.budget.tokens, 3))))
+registry.register(Gauge(
+    "loan_dependency_timeout_seconds", "Current adaptive timeout", ("dependency", "route"),
+    function=_per_route(lambda t: round(t.current(), 6)), multiprocess_mode="max"))
+registry.register(Gauge(
+    "loan_dependency_latency_ewma_seconds", "Smoothed call latency", ("dependency", "route"),
+    function=_per_route(lambda t: round(t.latency or 0.0, 6)), multiprocess_mode="max"))
@@ -1,52 +1,120 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from app import schemas, crud
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from app import schemas, crud, overdue
 from app.database import get_db
+from app.http_client import get_http_client
+from app.idempotency import idempotent_request
+from app.fast_json import FAST_JSON, FastJSONResponse
 import httpx
+from typing import Optional
+import logging
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/loans", tags=["Loans"])
 
 @router.post("/", response_model=schemas.Loan, status_code=201)
-async def issue_loan(loan: schemas.LoanCreate, db: Session = Depends(get_db)):
+async def issue_loan(
+    loan: schemas.LoanCreate,
+    idempotency_key: Optional[str] = Header(None, max_length=200),
+    db: AsyncSession = Depends(get_db),
+    client: httpx.AsyncClient = Depends(get_http_client)
+):
     try:
-        return await crud.create_loan(db, loan)
+        idempotent = idempotent_request(idempotency_key, "loans.create", loan)
+        if idempotent and (replay := await idempotent.replay(db)):
+            return replay
+        return await crud.create_loan(db, client, loan, idempotent)
     except HTTPException as e:
         raise e
-    except Exception as ex:
-        print(f"Unexpected error in issue_loan: {ex}")
+    except Exception:
+        logger.exception("Unexpected error in issue_loan")
         raise HTTPException(status_code=500, detail="Internal server error")
 
 @router.post("/returns/", response_model=schemas.Loan)
-async def return_book(return_data: schemas.LoanReturn, db: Session = Depends(get_db)):
+async def return_book(
+    return_data: schemas.LoanReturn,
+    idempotency_key: Optional[str] = Header(None, max_length=200),
+    db: AsyncSession = Depends(get_db),
+    client: httpx.AsyncClient = Depends(get_http_client)
+):
     try:
-        return await crud.return_loan(db, return_data.loan_id)
+        idempotent = idempotent_request(idempotency_key, "loans.return", return_data)
+        if idempotent and (replay := await idempotent.replay(db)):
+            return replay
+        return await crud.return_loan(db, client, return_data.loan_id, idempotent)
     except HTTPException as e:
         raise e
     except Exception:
         raise HTTPException(status_code=500, detail="Internal server error")
 
 @router.get("/user/{user_id}", response_model=schemas.UserLoanHistory)
-async def get_user_loans(user_id: int, db: Session = Depends(get_db)):
+async def get_user_loans(
+    user_id: int,
+    limit: Optional[int] = Query(None, ge=1, le=500, description="Page size; omit for the full history"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    # No "estimate" here: planner statistics cannot estimate one user's loan count, and the exact count is an index range
+    total: str = Query("exact", pattern="^(exact|none)$"),
+    db: AsyncSession = Depends(get_db),
+    client: httpx.AsyncClient = Depends(get_http_client)
+):
     try:
-        return await crud.get_loan_history_details(db, user_id)
+        history = await crud.get_loan_history_details(db, client, user_id, limit, cursor, total)
+        # Already shaped as UserLoanHistory, so the fast path can skip re-validating it
+        if FAST_JSON:
+            return FastJSONResponse(history)
+        return history
     except HTTPException as e:
         raise e
     except Exception:
         raise HTTPException(status_code=500, detail="Internal server error")
 
-@router.get("/{loan_id}", response_model=schemas.LoanDetails)
-async def get_loan(loan_id: int, db: Session = Depends(get_db)):
+# Declared before /{loan_id} so "overdue" is not parsed as a loan id
+@router.get("/overdue", response_model=schemas.OverdueLoanPage)
+async def get_overdue_loans(
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    live: bool = Query(False, description="Query the database instead of the scanner's snapshot"),
+    db: AsyncSession = Depends(get_db),
+    client: httpx.AsyncClient = Depends(get_http_client)
+):
     try:
-        return await crud.get_loan_details(db, loan_id)
+        page = await overdue.get_overdue(db, client, limit, cursor, live)
+        if FAST_JSON:
+            return FastJSONResponse(page)
+        return page
     except HTTPException as e:
         raise e
     except Exception:
+        logger.exception("Unexpected error in get_overdue_loans")
         raise HTTPException(status_code=500, detail="Internal server error")
 
+@router.get("/{loan_id}", response_model=schemas.LoanDetails)
+async def get_loan(loan_id: int, response: Response, db: AsyncSession = Depends(get_db), client: httpx.AsyncClient = Depends(get_http_client)):
+    timings = {}
+    error = None
+    try:
+        return await crud.get_loan_details(db, client, loan_id, timings)
+    except HTTPException as e:
+        error = e
+        raise e
+    except Exception:
+        error = HTTPException(status_code=500, detail="Internal server error")
+        raise error
+    finally:
+        # Per-dependency latency breakdown, e.g. "user-service;dur=12.4, book-service;dur=8.1";
+        # also sent with 503/504s, where it shows which dependency was slow or failing
+        if timings:
+            server_timing = ", ".join(f"{name};dur={duration:.1f}" for name, duration in timings.items())
+            if error is None:
+                response.headers["Server-Timing"] = server_timing
+            else:
+                error.headers = {**(error.headers or {}), "Server-Timing": server_timing}
+
 @router.put("/{loan_id}/extend", response_model=schemas.LoanExtensionResponse)
-def extend_loan(loan_id: int, extension: schemas.LoanExtensionRequest, db: Session = Depends(get_db)):
+async def extend_loan(loan_id: int, extension: schemas.LoanExtensionRequest, db: AsyncSession = Depends(get_db)):
     try:
-        updated_loan = crud.extend_loan_due_date(db, loan_id, extension.extension_days)
+        updated_loan = await crud.extend_loan_due_date(db, loan_id, extension.extension_days)
         if not updated_loan:
             raise HTTPException(status_code=400, detail="Extension failed")
         return updated_loan
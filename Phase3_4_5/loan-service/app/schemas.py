@@ -47,7 +47,8 @@ class UserLoanRecord(BaseModel):
 
 class UserLoanHistory(BaseModel):
     loans: List[UserLoanRecord]
-    total: int
+    total: Optional[int] = None
+    next_cursor: Optional[str] = None
 
     class Config:
         orm_mode = True
@@ -65,6 +66,22 @@ class LoanDetails(BaseModel):
     class Config:
         orm_mode = True
 
+class OverdueLoan(BaseModel):
+    id: int
+    # None when the user or book no longer exists in its service
+    user: Optional[UserInfo] = None
+    book: Optional[BookInfo] = None
+    issue_date: datetime
+    due_date: datetime
+    days_overdue: int
+
+class OverdueLoanPage(BaseModel):
+    loans: List[OverdueLoan]
+    total: Optional[int] = None
+    next_cursor: Optional[str] = None
+    generated_at: datetime
+    source: str
+
 class LoanExtensionRequest(BaseModel):
     extension_days: int
 
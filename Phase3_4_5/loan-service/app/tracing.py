@@ -0,0 +1,244 @@
+# Shared module, copied into every service: edit loan-service's copy, then run benchmarks/check_shared_modules.py
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+import asyncio
+import httpx
+import json
+import logging
+import os
+import random
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = os.getenv("SERVICE_NAME", "loan-service")
+# none | file | zipkin
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "none")
+TRACE_FILE = os.getenv("TRACE_FILE", "./traces.jsonl")
+TRACE_COLLECTOR_URL = os.getenv("TRACE_COLLECTOR_URL", "http://zipkin:9411/api/v2/spans")
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))
+TRACE_FLUSH_INTERVAL = float(os.getenv("TRACE_FLUSH_INTERVAL", "2.0"))
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "10000"))
+TRACE_STATEMENT_MAX_LENGTH = 2000
+
+ENABLED = TRACE_EXPORTER in ("file", "zipkin")
+
+_TRACEPARENT = re.compile(r"^([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+_current = ContextVar("current_span", default=None)
+# Finished sampled spans waiting for the exporter; the oldest are dropped if it falls behind
+_finished = deque(maxlen=TRACE_BUFFER_SIZE)
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "kind", "sampled",
+                 "timestamp", "start", "duration", "tags")
+
+    def __init__(self, name: str, kind: str, trace_id: str, parent_id: str, sampled: bool, tags=None):
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.sampled = sampled
+        self.timestamp = time.time()
+        self.start = time.perf_counter()
+        self.duration = None
+        self.tags = dict(tags) if tags else {}
+
+    def set_tag(self, key: str, value):
+        self.tags[key] = value
+
+    def set_error(self, error: BaseException):
+        self.tags["error"] = f"{type(error).__name__}: {error}"
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def finish(self):
+        if self.duration is not None:
+            return
+        self.duration = time.perf_counter() - self.start
+        if self.sampled and ENABLED:
+            _finished.append(self)
+
+    def to_zipkin(self):
+        span = {
+            "traceId": self.trace_id,
+            "id": self.span_id,
+            "name": self.name,
+            "timestamp": int(self.timestamp * 1_000_000),
+            "duration": max(1, int((self.duration or 0) * 1_000_000)),
+            "localEndpoint": {"serviceName": SERVICE_NAME},
+            "tags": {key: str(value) for key, value in self.tags.items()},
+        }
+        if self.parent_id:
+            span["parentId"] = self.parent_id
+        if self.kind != "INTERNAL":
+            span["kind"] = self.kind
+        return span
+
+def parse_traceparent(value: str):
+    # W3C trace context: version-trace_id-parent_id-flags; anything malformed starts a new trace
+    match = _TRACEPARENT.match(value.strip().lower()) if value else None
+    if not match:
+        return None
+    version, trace_id, parent_id, flags = match.groups()
+    if version == "ff" or trace_id == "0" * 32 or parent_id == "0" * 16:
+        return None
+    return trace_id, parent_id, bool(int(flags, 16) & 1)
+
+def current_span():
+    return _current.get()
+
+def current_traceparent():
+    span = _current.get()
+    return span.traceparent() if span else None
+
+def start_span(name: str, kind: str = "INTERNAL", parent: str = None, tags=None) -> Span:
+    # Parent is an explicit traceparent (incoming request, outbox message) or else the active span
+    remote = parse_traceparent(parent) if parent else None
+    if remote:
+        trace_id, parent_id, sampled = remote
+    elif _current.get() is not None:
+        active = _current.get()
+        trace_id, parent_id, sampled = active.trace_id, active.span_id, active.sampled
+    else:
+        trace_id, parent_id = os.urandom(16).hex(), None
+        sampled = ENABLED and random.random() < TRACE_SAMPLE_RATE
+    return Span(name, kind, trace_id, parent_id, sampled, tags)
+
+@contextmanager
+def span(name: str, kind: str = "INTERNAL", parent: str = None, **tags):
+    active = start_span(name, kind, parent, tags)
+    token = _current.set(active)
+    try:
+        yield active
+    except BaseException as e:
+        active.set_error(e)
+        raise
+    finally:
+        _current.reset(token)
+        active.finish()
+
+class TracingMiddleware:
+    # Pure ASGI so the span stays in the context the route handler and its DB session run in
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        parent = None
+        for name, value in scope["headers"]:
+            if name == b"traceparent":
+                parent = value.decode("latin-1")
+                break
+        server_span = start_span(f"{scope['method']} {scope['path']}", "SERVER", parent, {
+            "http.method": scope["method"],
+            "http.path": scope["path"],
+        })
+        token = _current.set(server_span)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                server_span.set_tag("http.status_code", message["status"])
+                # Lets a caller look the request up in the trace store
+                message = {**message, "headers": [*message.get("headers", []), (b"x-trace-id", server_span.trace_id.encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except BaseException as e:
+            server_span.set_error(e)
+            raise
+        finally:
+            route = getattr(scope.get("route"), "path", None)
+            if route:
+                server_span.name = f"{scope['method']} {route}"
+                server_span.set_tag("http.route", route)
+            _current.reset(token)
+            server_span.finish()
+
+def instrument_engine(engine):
+    from sqlalchemy import event
+
+    sync_engine = getattr(engine, "sync_engine", engine)
+    system = sync_engine.dialect.name
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        # Only traced requests pay for a span; the stack keeps nested/queued executes paired
+        parent = _current.get()
+        query_span = None
+        if parent is not None and parent.sampled:
+            verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "SQL"
+            query_span = start_span(f"db {verb}", "CLIENT", tags={
+                "db.system": system,
+                "db.statement": statement[:TRACE_STATEMENT_MAX_LENGTH],
+            })
+            if executemany:
+                query_span.set_tag("db.executemany", True)
+        conn.info.setdefault("trace_spans", []).append(query_span)
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        query_span = conn.info["trace_spans"].pop()
+        if query_span is not None:
+            query_span.finish()
+
+    @event.listens_for(sync_engine, "handle_error")
+    def handle_error(context):
+        spans = context.connection.info.get("trace_spans") if context.connection is not None else None
+        query_span = spans.pop() if spans else None
+        if query_span is not None:
+            query_span.set_error(context.original_exception)
+            query_span.finish()
+
+async def _inject(request):
+    client_span = start_span(f"{request.method} {request.url.host}", "CLIENT", tags={
+        "http.method": request.method,
+        "http.url": str(request.url.copy_with(query=None)),
+    })
+    request.headers["traceparent"] = client_span.traceparent()
+    request.extensions["trace_span"] = client_span
+
+async def _finish(response):
+    client_span = response.request.extensions.get("trace_span")
+    if client_span is not None:
+        client_span.set_tag("http.status_code", response.status_code)
+        client_span.finish()
+
+def httpx_event_hooks():
+    # Spans for calls that fail before a response arrive are dropped; callers wrap their own span around retries
+    return {"request": [_inject], "response": [_finish]}
+
+def _write_file(lines):
+    with open(TRACE_FILE, "a") as f:
+        f.write("".join(lines))
+
+async def flush(client: httpx.AsyncClient = None):
+    spans = [_finished.popleft() for _ in range(len(_finished))]
+    if not spans:
+        return
+    payload = [s.to_zipkin() for s in spans]
+    try:
+        if TRACE_EXPORTER == "file":
+            await asyncio.to_thread(_write_file, [json.dumps(s) + "\n" for s in payload])
+        elif client is not None:
+            response = await client.post(TRACE_COLLECTOR_URL, json=payload)
+            response.raise_for_status()
+    except (OSError, httpx.HTTPError) as e:
+        logger.warning("Trace export failed", extra={"spans": len(spans), "error": str(e)})
+
+async def run_exporter():
+    if not ENABLED:
+        return
+    # Its own client without trace hooks, so exporting never produces more spans
+    async with httpx.AsyncClient(timeout=5.0) as client:
+        try:
+            while True:
+                await asyncio.sleep(TRACE_FLUSH_INTERVAL)
+                await flush(client)
+        finally:
+            await flush(client)
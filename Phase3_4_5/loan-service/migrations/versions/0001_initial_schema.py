@@ -0,0 +1,42 @@
+"""Initial loans schema
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0001"
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Databases bootstrapped by the old import-time create_all already have the table
+    if not op.get_context().as_sql and sa.inspect(op.get_bind()).has_table("loans"):
+        return
+    op.create_table(
+        "loans",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("book_id", sa.Integer(), nullable=False),
+        sa.Column("issue_date", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("due_date", sa.DateTime(), nullable=False),
+        sa.Column("return_date", sa.DateTime(), nullable=True),
+        sa.Column("status", sa.Enum("ACTIVE", "RETURNED", name="loanstatus")),
+        sa.Column("extensions_count", sa.Integer()),
+    )
+    op.create_index("ix_loans_id", "loans", ["id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_loans_id", table_name="loans")
+    op.drop_table("loans")
+    sa.Enum(name="loanstatus").drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,41 @@
+"""Indexes for loan history, per-book and overdue queries
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0002"
+down_revision: Union[str, None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+ACTIVE = sa.text("status = 'ACTIVE'")
+
+
+def upgrade() -> None:
+    # CONCURRENTLY keeps the loans table writable while the indexes build on PostgreSQL
+    concurrently = op.get_bind().dialect.name == "postgresql"
+    with op.get_context().autocommit_block():
+        # History is filtered by user and paged by id (ids increase with issue_date)
+        op.create_index("ix_loans_user_id_id", "loans", ["user_id", "id"],
+                        postgresql_concurrently=concurrently, if_not_exists=True)
+        op.create_index("ix_loans_book_id", "loans", ["book_id"],
+                        postgresql_concurrently=concurrently, if_not_exists=True)
+        # Only ACTIVE loans can be overdue, so the partial index stays small
+        op.create_index("ix_loans_active_due_date", "loans", ["due_date", "id"],
+                        postgresql_where=ACTIVE, sqlite_where=ACTIVE,
+                        postgresql_concurrently=concurrently, if_not_exists=True)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_loans_active_due_date", table_name="loans")
+    op.drop_index("ix_loans_book_id", table_name="loans")
+    op.drop_index("ix_loans_user_id_id", table_name="loans")
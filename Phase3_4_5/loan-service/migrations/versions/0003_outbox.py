@@ -0,0 +1,50 @@
+"""Transactional outbox and pending/cancelled loan states
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0003"
+down_revision: Union[str, None] = "0002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+PENDING = sa.text("status = 'PENDING'")
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name == "postgresql":
+        # ALTER TYPE ... ADD VALUE cannot run inside a transaction block
+        with op.get_context().autocommit_block():
+            op.execute("ALTER TYPE loanstatus ADD VALUE IF NOT EXISTS 'PENDING'")
+            op.execute("ALTER TYPE loanstatus ADD VALUE IF NOT EXISTS 'CANCELLED'")
+    op.create_table(
+        "outbox",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("topic", sa.String(), nullable=False),
+        sa.Column("loan_id", sa.Integer(), nullable=True),
+        sa.Column("idempotency_key", sa.String(), nullable=False, unique=True),
+        sa.Column("payload", sa.JSON(), nullable=False),
+        sa.Column("status", sa.String(), nullable=False),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.Column("next_attempt_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("last_error", sa.String(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("sent_at", sa.DateTime(timezone=True), nullable=True),
+    )
+    op.create_index("ix_outbox_pending", "outbox", ["next_attempt_at", "id"],
+                    postgresql_where=PENDING, sqlite_where=PENDING)
+
+
+def downgrade() -> None:
+    # PostgreSQL cannot drop enum values; PENDING/CANCELLED stay in loanstatus
+    op.drop_index("ix_outbox_pending", table_name="outbox")
+    op.drop_table("outbox")
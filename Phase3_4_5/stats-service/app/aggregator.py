@@ -0,0 +1,174 @@
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from app.sketch import CountMinSketch, TopK
+import asyncio
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+STATS_TOP_K = int(os.getenv("STATS_TOP_K", "100"))
+STATS_SKETCH_WIDTH = int(os.getenv("STATS_SKETCH_WIDTH", "2048"))
+STATS_SKETCH_DEPTH = int(os.getenv("STATS_SKETCH_DEPTH", "4"))
+STATS_SNAPSHOT_PATH = os.getenv("STATS_SNAPSHOT_PATH", "./stats_snapshot.json")
+STATS_SNAPSHOT_INTERVAL = float(os.getenv("STATS_SNAPSHOT_INTERVAL", "30"))
+STATS_DEDUP_WINDOW = int(os.getenv("STATS_DEDUP_WINDOW", "100000"))
+STATS_DAYS_KEPT = 7
+
+def _parse_time(value):
+    if value is None:
+        return None
+    moment = value if isinstance(value, datetime) else datetime.fromisoformat(value)
+    return moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+
+class StatsAggregator:
+    # In-memory rollups fed by loan events; single event loop, so no locking
+    def __init__(self):
+        self.popular_books = TopK(STATS_TOP_K, CountMinSketch(STATS_SKETCH_WIDTH, STATS_SKETCH_DEPTH))
+        self.active_users = TopK(STATS_TOP_K, CountMinSketch(STATS_SKETCH_WIDTH, STATS_SKETCH_DEPTH))
+        # Exact state for loans still out: {loan_id: {"user_id", "book_id", "due_date"}}
+        self.active_loans = {}
+        self.current_borrows = {}
+        # Loans already returned; the outbox sends concurrently, so loan_created can arrive after its return
+        self._returned = OrderedDict()
+        self.daily = {}
+        self._seen = OrderedDict()
+        self.events_applied = 0
+        self.events_duplicate = 0
+        self.dirty = False
+
+    def _seen_before(self, event_id: str) -> bool:
+        # Loan-service retries deliveries, so the same event may arrive more than once
+        if event_id in self._seen:
+            return True
+        self._seen[event_id] = None
+        if len(self._seen) > STATS_DEDUP_WINDOW:
+            self._seen.popitem(last=False)
+        return False
+
+    def _mark_returned(self, loan_id: int):
+        self._returned[loan_id] = None
+        if len(self._returned) > STATS_DEDUP_WINDOW:
+            self._returned.popitem(last=False)
+
+    def _bump_day(self, moment: datetime, field: str):
+        day = moment.astimezone(timezone.utc).date().isoformat()
+        counts = self.daily.setdefault(day, {"loans": 0, "returns": 0})
+        counts[field] += 1
+        cutoff = (datetime.now(timezone.utc) - timedelta(days=STATS_DAYS_KEPT)).date().isoformat()
+        for old in [d for d in self.daily if d < cutoff]:
+            del self.daily[old]
+
+    def apply(self, event: dict) -> bool:
+        event_type = event["type"]
+        loan_id = event["loan_id"]
+        if self._seen_before(f"{event_type}:{loan_id}:{event.get('occurred_at')}"):
+            self.events_duplicate += 1
+            return False
+        occurred_at = _parse_time(event.get("occurred_at")) or datetime.now(timezone.utc)
+
+        if event_type == "loan_created":
+            self.popular_books.add(event["book_id"])
+            self.active_users.add(event["user_id"])
+            if loan_id not in self._returned:
+                if loan_id not in self.active_loans:
+                    self.current_borrows[event["user_id"]] = self.current_borrows.get(event["user_id"], 0) + 1
+                self.active_loans[loan_id] = {
+                    "user_id": event["user_id"],
+                    "book_id": event["book_id"],
+                    "due_date": event.get("due_date"),
+                }
+            self._bump_day(occurred_at, "loans")
+        elif event_type == "loan_returned":
+            loan = self.active_loans.pop(loan_id, None)
+            self._mark_returned(loan_id)
+            if loan:
+                remaining = self.current_borrows.get(loan["user_id"], 0) - 1
+                if remaining > 0:
+                    self.current_borrows[loan["user_id"]] = remaining
+                else:
+                    self.current_borrows.pop(loan["user_id"], None)
+            self._bump_day(occurred_at, "returns")
+        elif event_type == "loan_extended":
+            if loan_id in self.active_loans:
+                self.active_loans[loan_id]["due_date"] = event.get("due_date")
+        else:
+            raise ValueError(f"Unknown event type: {event_type}")
+        self.events_applied += 1
+        self.dirty = True
+        return True
+
+    def overdue_count(self, now: datetime = None) -> int:
+        now = now or datetime.now(timezone.utc)
+        return sum(
+            1 for loan in self.active_loans.values()
+            if loan["due_date"] and _parse_time(loan["due_date"]) < now
+        )
+
+    def loan_overview(self):
+        today = self.daily.get(datetime.now(timezone.utc).date().isoformat(), {"loans": 0, "returns": 0})
+        return {
+            "books_borrowed": len(self.active_loans),
+            "overdue_loans": self.overdue_count(),
+            "loans_today": today["loans"],
+            "returns_today": today["returns"],
+        }
+
+    def stats(self):
+        return {
+            "events_applied": self.events_applied,
+            "events_duplicate": self.events_duplicate,
+            "active_loans": len(self.active_loans),
+            "tracked_books": len(self.popular_books.counts),
+            "tracked_users": len(self.active_users.counts),
+        }
+
+    def to_dict(self):
+        return {
+            "popular_books": self.popular_books.to_dict(),
+            "active_users": self.active_users.to_dict(),
+            "active_loans": [[loan_id, loan] for loan_id, loan in self.active_loans.items()],
+            "returned": list(self._returned),
+            "daily": self.daily,
+            "seen": list(self._seen),
+            "events_applied": self.events_applied,
+        }
+
+    def load_dict(self, data):
+        self.popular_books = TopK.from_dict(data["popular_books"])
+        self.active_users = TopK.from_dict(data["active_users"])
+        self.active_loans = {loan_id: loan for loan_id, loan in data["active_loans"]}
+        self.current_borrows = {}
+        for loan in self.active_loans.values():
+            self.current_borrows[loan["user_id"]] = self.current_borrows.get(loan["user_id"], 0) + 1
+        self._returned = OrderedDict.fromkeys(data.get("returned", []))
+        self.daily = data["daily"]
+        self._seen = OrderedDict.fromkeys(data["seen"])
+        self.events_applied = data["events_applied"]
+
+    def save_snapshot(self, path: str = STATS_SNAPSHOT_PATH):
+        # Write-then-rename so a crash mid-write never leaves a truncated snapshot
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.to_dict(), f)
+        os.replace(tmp_path, path)
+        self.dirty = False
+
+    def load_snapshot(self, path: str = STATS_SNAPSHOT_PATH) -> bool:
+        if not os.path.exists(path):
+            return False
+        with open(path) as f:
+            self.load_dict(json.load(f))
+        return True
+
+aggregator = StatsAggregator()
+
+async def snapshot_periodically():
+    while True:
+        await asyncio.sleep(STATS_SNAPSHOT_INTERVAL)
+        if aggregator.dirty:
+            try:
+                aggregator.save_snapshot()
+            except OSError as e:
+                logger.error("Stats snapshot failed", extra={"error": str(e)})
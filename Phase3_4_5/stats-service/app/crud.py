@@ -0,0 +1,69 @@
+from fastapi import HTTPException
+from app.aggregator import aggregator
+import asyncio
+import httpx
+import os
+
+USER_SERVICE_URL = os.getenv("USER_SERVICE_URL", "http://user-service:5000")
+BOOK_SERVICE_URL = os.getenv("BOOK_SERVICE_URL", "http://book-service:5002")
+STATS_LIMIT = 10
+
+async def _get_json(client: httpx.AsyncClient, url: str, service: str, **params):
+    try:
+        response = await client.get(url, params=params or None)
+        response.raise_for_status()
+        return response.json()
+    except httpx.HTTPError:
+        raise HTTPException(status_code=503, detail=f"{service} unavailable")
+
+async def get_popular_books(client: httpx.AsyncClient, limit: int = STATS_LIMIT):
+    # Ask for a few extra ids so deleted books do not leave the list short
+    ranked = aggregator.popular_books.top(limit * 2)
+    if not ranked:
+        return []
+    books = await _get_json(
+        client, f"{BOOK_SERVICE_URL}/api/books/batch", "Book Service",
+        ids=",".join(str(book_id) for book_id, _ in ranked)
+    )
+    by_id = {book["id"]: book for book in books}
+    return [
+        {
+            "book_id": book_id,
+            "title": by_id[book_id]["title"],
+            "author": by_id[book_id]["author"],
+            "borrow_count": count
+        }
+        for book_id, count in ranked if book_id in by_id
+    ][:limit]
+
+async def get_active_users(client: httpx.AsyncClient, limit: int = STATS_LIMIT):
+    # Ask for a few extra ids so deleted users do not leave the list short
+    ranked = aggregator.active_users.top(limit * 2)
+    if not ranked:
+        return []
+    users = await _get_json(
+        client, f"{USER_SERVICE_URL}/api/users/batch", "User Service",
+        ids=",".join(str(user_id) for user_id, _ in ranked)
+    )
+    by_id = {user["id"]: user for user in users}
+    return [
+        {
+            "user_id": user_id,
+            "name": by_id[user_id]["name"],
+            "books_borrowed": count,
+            "current_borrows": aggregator.current_borrows.get(user_id, 0)
+        }
+        for user_id, count in ranked if user_id in by_id
+    ][:limit]
+
+async def get_overview(client: httpx.AsyncClient):
+    inventory, users = await asyncio.gather(
+        _get_json(client, f"{BOOK_SERVICE_URL}/api/books/summary", "Book Service"),
+        _get_json(client, f"{USER_SERVICE_URL}/api/users/summary", "User Service")
+    )
+    return {
+        "total_books": inventory["total_books"],
+        "total_users": users["total_users"],
+        "books_available": inventory["books_available"],
+        **aggregator.loan_overview()
+    }
@@ -0,0 +1,27 @@
+from fastapi import Request
+import httpx
+from app import instrumentation, log, tracing
+import os
+
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "5.0"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "50"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "10"))
+
+def create_http_client() -> httpx.AsyncClient:
+    metrics_hooks = instrumentation.httpx_event_hooks()
+    trace_hooks = tracing.httpx_event_hooks()
+    log_hooks = log.httpx_event_hooks()
+    return httpx.AsyncClient(
+        timeout=HTTP_TIMEOUT,
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        ),
+        event_hooks={
+            "request": [*metrics_hooks["request"], *trace_hooks["request"], *log_hooks["request"]],
+            "response": [*metrics_hooks["response"], *trace_hooks["response"]],
+        },
+    )
+
+def get_http_client(request: Request) -> httpx.AsyncClient:
+    return request.app.state.http_client
@@ -0,0 +1,220 @@
+# Shared module, copied into every service: edit loan-service's copy, then run benchmarks/check_shared_modules.py
+from bisect import bisect_left
+import asyncio
+import json
+import os
+import time
+
+# Seconds; tuned for in-cluster API calls and queries
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Set by gunicorn.conf.py when there are several workers: each one writes its series here and a scrape,
+# whichever worker takes it, merges them all
+METRICS_MULTIPROC_DIR = os.getenv("METRICS_MULTIPROC_DIR")
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "5"))
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names, values, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labelnames=(), function=None):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        # Keyed by the tuple of label values, so recording is one dict lookup
+        self._series = {}
+        # Optional callback returning {labelvalues: value}, read at scrape time
+        self.function = function
+
+    def render(self, samples=None):
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} {self.kind}"
+        for labelvalues, value in self._samples() if samples is None else samples:
+            yield f"{self.name}{_labels(self.labelnames, labelvalues)} {value}"
+
+    def _samples(self):
+        if self.function is not None:
+            return self.function().items()
+        return self._series.items()
+
+    def combine(self, total, value):
+        # Merging workers: counts add up
+        return value if total is None else total + value
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labelvalues, amount: float = 1):
+        self._series[labelvalues] = self._series.get(labelvalues, 0) + amount
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labelnames=(), function=None, multiprocess_mode: str = "sum"):
+        super().__init__(name, help_text, labelnames, function)
+        # "sum" or "max" across live workers; exited workers' gauges are dropped
+        self.multiprocess_mode = multiprocess_mode
+
+    def set(self, value: float, *labelvalues):
+        self._series[labelvalues] = value
+
+    def inc(self, *labelvalues, amount: float = 1):
+        self._series[labelvalues] = self._series.get(labelvalues, 0) + amount
+
+    def dec(self, *labelvalues, amount: float = 1):
+        self._series[labelvalues] = self._series.get(labelvalues, 0) - amount
+
+    def combine(self, total, value):
+        if total is None:
+            return value
+        return max(total, value) if self.multiprocess_mode == "max" else total + value
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labelvalues):
+        series = self._series.get(labelvalues)
+        if series is None:
+            # Per-bucket counts (made cumulative when rendered), sum, count
+            series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self, samples=None):
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} histogram"
+        for labelvalues, (counts, total, count) in self._series.items() if samples is None else samples:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, labelvalues, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labelvalues)} {total}"
+            yield f"{self.name}_count{_labels(self.labelnames, labelvalues)} {count}"
+
+    def combine(self, total, value):
+        if total is None:
+            return value
+        return [[a + b for a, b in zip(total[0], value[0])], total[1] + value[1], total[2] + value[2]]
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        if METRICS_MULTIPROC_DIR:
+            return self.render_merged(METRICS_MULTIPROC_DIR)
+        return "\n".join(line for metric in self.metrics for line in metric.render()) + "\n"
+
+    def write(self, directory: str):
+        # Write-then-rename so a scrape never reads half a file
+        path = os.path.join(directory, f"{os.getpid()}.json")
+        with open(f"{path}.tmp", "w") as f:
+            json.dump({metric.name: [[list(labels), value] for labels, value in metric._samples()]
+                       for metric in self.metrics}, f)
+        os.replace(f"{path}.tmp", path)
+
+    def render_merged(self, directory: str) -> str:
+        self.write(directory)
+        workers = []
+        for name in os.listdir(directory):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(directory, name)) as f:
+                    # gunicorn.conf.py renames an exited worker's file to dead-<pid>.json
+                    workers.append((not name.startswith("dead-"), json.load(f)))
+            except (OSError, ValueError):
+                continue
+        lines = []
+        for metric in self.metrics:
+            merged = {}
+            for live, series in workers:
+                # Counters and histograms keep exited workers' totals so they never go backwards
+                if metric.kind == "gauge" and not live:
+                    continue
+                for labels, value in series.get(metric.name, ()):
+                    merged[tuple(labels)] = metric.combine(merged.get(tuple(labels)), value)
+            lines.extend(metric.render(merged.items()))
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+http_requests = registry.register(Counter(
+    "http_server_requests_total", "HTTP requests handled", ("method", "route", "status")))
+http_duration = registry.register(Histogram(
+    "http_server_request_duration_seconds", "HTTP request latency", ("method", "route")))
+http_in_flight = registry.register(Gauge(
+    "http_server_requests_in_flight", "HTTP requests currently being handled"))
+http_client_duration = registry.register(Histogram(
+    "http_client_request_duration_seconds", "Outbound HTTP call latency", ("host", "method", "status")))
+
+class MetricsMiddleware:
+    # Pure ASGI (no BaseHTTPMiddleware) so streaming responses and the request path stay cheap
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        http_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_in_flight.dec()
+            # The matched route template ("/api/loans/{loan_id}") keeps label cardinality bounded
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            http_duration.observe(time.perf_counter() - start, scope["method"], path)
+            http_requests.inc(scope["method"], path, str(status[0]))
+
+async def _start_timer(request):
+    request.extensions["metrics_start"] = time.perf_counter()
+
+async def _observe_response(response):
+    request = response.request
+    start = request.extensions.get("metrics_start")
+    if start is not None:
+        http_client_duration.observe(time.perf_counter() - start, request.url.host, request.method, str(response.status_code))
+
+def httpx_event_hooks():
+    # Response hooks fire once headers arrive, which is when the caller starts waiting on the body
+    return {"request": [_start_timer], "response": [_observe_response]}
+
+def render_metrics() -> str:
+    return registry.render()
+
+async def run_flusher():
+    # Publishes this worker's series for the other workers' scrapes; the last write happens on shutdown
+    if not METRICS_MULTIPROC_DIR:
+        return
+    try:
+        while True:
+            registry.write(METRICS_MULTIPROC_DIR)
+            await asyncio.sleep(METRICS_FLUSH_INTERVAL)
+    finally:
+        registry.write(METRICS_MULTIPROC_DIR)
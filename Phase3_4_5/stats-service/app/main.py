@@ -0,0 +1,56 @@
+from contextlib import asynccontextmanager
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+from fastapi.middleware.cors import CORSMiddleware
+from app.routers import router
+from app import instrumentation, log, tracing
+from app.http_client import create_http_client
+from app.aggregator import aggregator, snapshot_periodically
+import asyncio
+
+log.configure_logging()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    aggregator.load_snapshot()
+    app.state.http_client = create_http_client()
+    snapshotter = asyncio.create_task(snapshot_periodically())
+    exporter = asyncio.create_task(tracing.run_exporter())
+    yield
+    snapshotter.cancel()
+    exporter.cancel()
+    await asyncio.gather(snapshotter, exporter, return_exceptions=True)
+    aggregator.save_snapshot()
+    await app.state.http_client.aclose()
+
+app = FastAPI(title="Stats Service", lifespan=lifespan)
+
+app.add_middleware(instrumentation.MetricsMiddleware)
+app.add_middleware(tracing.TracingMiddleware)
+app.add_middleware(log.RequestLogMiddleware)
+
+# Configure CORS
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+# Health check endpoint
+@app.get("/health")
+async def health_check():
+    return {"status": "healthy"}
+
+# Event and sketch counters
+@app.get("/metrics/aggregator")
+async def aggregator_metrics():
+    return aggregator.stats()
+
+# Request and outbound call metrics in Prometheus text format
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return instrumentation.render_metrics()
+
+app.include_router(router)
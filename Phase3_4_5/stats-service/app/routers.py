@@ -0,0 +1,33 @@
+from fastapi import APIRouter, Depends, Header, HTTPException
+from typing import List, Optional
+from app import schemas, crud
+from app.aggregator import aggregator
+from app.http_client import get_http_client
+import httpx
+import os
+import secrets
+
+# Shared with loan-service: only its outbox may feed events in (nginx also blocks the path at the gateway)
+STATS_EVENTS_TOKEN = os.getenv("STATS_EVENTS_TOKEN")
+
+router = APIRouter(prefix="/api/stats", tags=["Stats"])
+
+def require_events_token(x_stats_token: Optional[str] = Header(None)):
+    if STATS_EVENTS_TOKEN and not (x_stats_token and secrets.compare_digest(x_stats_token, STATS_EVENTS_TOKEN)):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+@router.post("/events", response_model=schemas.EventAck, status_code=202, dependencies=[Depends(require_events_token)])
+async def ingest_event(event: schemas.LoanEvent):
+    return {"applied": aggregator.apply(event.model_dump(mode="json"))}
+
+@router.get("/books/popular", response_model=List[schemas.PopularBook])
+async def get_most_borrowed_books(client: httpx.AsyncClient = Depends(get_http_client)):
+    return await crud.get_popular_books(client)
+
+@router.get("/users/active", response_model=List[schemas.ActiveUser])
+async def get_active_users(client: httpx.AsyncClient = Depends(get_http_client)):
+    return await crud.get_active_users(client)
+
+@router.get("/overview", response_model=schemas.OverviewStats)
+async def get_overview_stats(client: httpx.AsyncClient = Depends(get_http_client)):
+    return await crud.get_overview(client)
@@ -0,0 +1,41 @@
+from pydantic import BaseModel
+from typing import Optional
+from datetime import datetime
+from enum import Enum
+
+class LoanEventType(str, Enum):
+    loan_created = "loan_created"
+    loan_returned = "loan_returned"
+    loan_extended = "loan_extended"
+
+class LoanEvent(BaseModel):
+    type: LoanEventType
+    loan_id: int
+    user_id: int
+    book_id: int
+    due_date: Optional[datetime] = None
+    occurred_at: datetime
+
+class EventAck(BaseModel):
+    applied: bool
+
+class PopularBook(BaseModel):
+    book_id: int
+    title: str
+    author: str
+    borrow_count: int
+
+class ActiveUser(BaseModel):
+    user_id: int
+    name: str
+    books_borrowed: int
+    current_borrows: int
+
+class OverviewStats(BaseModel):
+    total_books: int
+    total_users: int
+    books_available: int
+    books_borrowed: int
+    overdue_loans: int
+    loans_today: int
+    returns_today: int
@@ -0,0 +1,80 @@
+from hashlib import blake2b
+import heapq
+
+class CountMinSketch:
+    # Fixed-size frequency table: estimates never undercount, and overcount by at most ~2N/width
+    def __init__(self, width: int = 2048, depth: int = 4, table=None):
+        if not 1 <= depth <= 16:
+            raise ValueError("depth must be between 1 and 16")
+        self.width = width
+        self.depth = depth
+        self.table = table or [[0] * width for _ in range(depth)]
+
+    def _cells(self, key):
+        # One 4-byte slice of a single digest per row
+        digest = blake2b(str(key).encode(), digest_size=4 * self.depth).digest()
+        for row in range(self.depth):
+            yield row, int.from_bytes(digest[4 * row:4 * row + 4], "little") % self.width
+
+    def add(self, key, count: int = 1) -> int:
+        estimate = None
+        for row, col in self._cells(key):
+            self.table[row][col] += count
+            value = self.table[row][col]
+            estimate = value if estimate is None else min(estimate, value)
+        return estimate
+
+    def estimate(self, key) -> int:
+        return min(self.table[row][col] for row, col in self._cells(key))
+
+    def to_dict(self):
+        return {"width": self.width, "depth": self.depth, "table": self.table}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["width"], data["depth"], data["table"])
+
+class TopK:
+    # Heavy hitters over a count-min sketch; the heap keeps the current minimum at hand
+    def __init__(self, k: int = 100, sketch: CountMinSketch = None):
+        self.k = k
+        self.sketch = sketch or CountMinSketch()
+        self.counts = {}
+        self._heap = []
+
+    def _floor(self):
+        # Heap entries go stale when a key's count grows or it is evicted; skip those lazily
+        while self._heap:
+            count, key = self._heap[0]
+            if self.counts.get(key) == count:
+                return count, key
+            heapq.heappop(self._heap)
+        return None
+
+    def add(self, key, count: int = 1):
+        estimate = self.sketch.add(key, count)
+        if key not in self.counts and len(self.counts) >= self.k:
+            floor_count, floor_key = self._floor()
+            if estimate <= floor_count:
+                return
+            del self.counts[floor_key]
+        self.counts[key] = estimate
+        heapq.heappush(self._heap, (estimate, key))
+        if len(self._heap) > 4 * self.k:
+            self._heap = [(c, k) for k, c in self.counts.items()]
+            heapq.heapify(self._heap)
+
+    def top(self, n: int = None):
+        ranked = sorted(self.counts.items(), key=lambda item: (-item[1], item[0]))
+        return ranked[:n] if n else ranked
+
+    def to_dict(self):
+        return {"k": self.k, "sketch": self.sketch.to_dict(), "counts": [[k, c] for k, c in self.counts.items()]}
+
+    @classmethod
+    def from_dict(cls, data):
+        top = cls(data["k"], CountMinSketch.from_dict(data["sketch"]))
+        top.counts = {k: c for k, c in data["counts"]}
+        top._heap = [(c, k) for k, c in top.counts.items()]
+        heapq.heapify(top._heap)
+        return top
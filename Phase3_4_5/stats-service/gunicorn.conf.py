@@ -0,0 +1,18 @@
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5003')}"
+# The rollups live in this process's memory: exactly one worker, whatever WEB_CONCURRENCY says
+workers = 1
+# uvloop and httptools are picked up automatically when installed (uvicorn[standard])
+worker_class = "uvicorn.workers.UvicornWorker"
+reload = os.getenv("RELOAD", "false").lower() in ("1", "true", "yes")
+
+# Time to finish in-flight requests and write the final snapshot on SIGTERM
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+timeout = int(os.getenv("WORKER_TIMEOUT", "60"))
+keepalive = int(os.getenv("KEEPALIVE", "75"))
+
+# Access logging is done by the app (app/log.py)
+accesslog = None
+errorlog = "-"
+loglevel = os.getenv("LOG_LEVEL", "info").lower()
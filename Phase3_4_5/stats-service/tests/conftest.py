@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Run from the service directory: the service's own "app" package, not another service's
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
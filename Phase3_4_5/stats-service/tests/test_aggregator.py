@@ -0,0 +1,40 @@
+from datetime import datetime, timedelta, timezone
+from app.aggregator import StatsAggregator
+
+def loan_event(event_type, occurred_at, loan_id=1, user_id=7, book_id=3):
+    return {
+        "type": event_type, "loan_id": loan_id, "user_id": user_id, "book_id": book_id,
+        "due_date": (occurred_at - timedelta(days=1)).isoformat(), "occurred_at": occurred_at.isoformat(),
+    }
+
+def test_return_before_create_leaves_no_active_loan():
+    now = datetime.now(timezone.utc)
+    aggregator = StatsAggregator()
+    assert aggregator.apply(loan_event("loan_returned", now))
+    assert aggregator.apply(loan_event("loan_created", now - timedelta(days=20)))
+
+    overview = aggregator.loan_overview()
+    assert overview["books_borrowed"] == 0
+    assert overview["overdue_loans"] == 0
+    assert aggregator.current_borrows == {}
+    # Still counted towards popularity and the day's totals
+    assert aggregator.popular_books.counts == {3: 1}
+    assert overview["returns_today"] == 1
+
+def test_in_order_events():
+    now = datetime.now(timezone.utc)
+    aggregator = StatsAggregator()
+    aggregator.apply(loan_event("loan_created", now))
+    assert aggregator.current_borrows == {7: 1}
+    aggregator.apply(loan_event("loan_returned", now))
+    assert aggregator.loan_overview()["books_borrowed"] == 0
+    assert aggregator.current_borrows == {}
+
+def test_returned_loans_survive_a_snapshot():
+    now = datetime.now(timezone.utc)
+    aggregator = StatsAggregator()
+    aggregator.apply(loan_event("loan_returned", now))
+    restored = StatsAggregator()
+    restored.load_dict(aggregator.to_dict())
+    restored.apply(loan_event("loan_created", now - timedelta(days=20)))
+    assert restored.loan_overview()["books_borrowed"] == 0
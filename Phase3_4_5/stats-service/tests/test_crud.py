@@ -0,0 +1,22 @@
+import asyncio
+import httpx
+from app import crud
+from app.aggregator import StatsAggregator
+
+def test_active_users_fills_the_limit_past_deleted_users(monkeypatch):
+    aggregator = StatsAggregator()
+    for user_id in range(1, 7):
+        for _ in range(10 - user_id):
+            aggregator.active_users.add(user_id)
+    monkeypatch.setattr(crud, "aggregator", aggregator)
+
+    def users_batch(request):
+        ids = [int(i) for i in request.url.params["ids"].split(",")]
+        # Users 1 and 2 have been deleted
+        return httpx.Response(200, json=[{"id": i, "name": f"user {i}"} for i in ids if i > 2])
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(users_batch)) as client:
+            return await crud.get_active_users(client, limit=3)
+
+    assert [user["user_id"] for user in asyncio.run(run())] == [3, 4, 5]
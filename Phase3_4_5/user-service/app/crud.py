@@ -1,27 +1,37 @@
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, select
 from app import models, schemas
 from fastapi import HTTPException
+from typing import List
 
-def create_user(db: Session, user: schemas.UserCreate):
-    existing_user = db.query(models.User).filter(models.User.email == user.email).first()
+async def create_user(db: AsyncSession, user: schemas.UserCreate):
+    existing_user = (await db.execute(select(models.User).where(models.User.email == user.email))).scalars().first()
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     db_user = models.User(**user.dict())
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     return db_user
 
-def get_user_by_id(db: Session, user_id: int):
-    return db.query(models.User).filter(models.User.id == user_id).first()
+async def get_user_by_id(db: AsyncSession, user_id: int):
+    return await db.get(models.User, user_id)
 
-def update_user(db: Session, user_id: int, user_data: schemas.UserUpdate):
-    db_user = get_user_by_id(db, user_id)
+async def get_users_by_ids(db: AsyncSession, user_ids: List[int]):
+    if not user_ids:
+        return []
+    return (await db.execute(select(models.User).where(models.User.id.in_(user_ids)))).scalars().all()
+
+async def count_users(db: AsyncSession):
+    return (await db.execute(select(func.count()).select_from(models.User))).scalar_one()
+
+async def update_user(db: AsyncSession, user_id: int, user_data: schemas.UserUpdate):
+    db_user = await get_user_by_id(db, user_id)
     if not db_user:
         return None
     for key, value in user_data.dict(exclude_unset=True).items():
         setattr(db_user, key, value)
     db_user.updated_at = func.now()
-    db.commit()
-    db.refresh(db_user)
-    return db_user
\ No newline at end of file
+    await db.commit()
+    await db.refresh(db_user)
+    return db_user
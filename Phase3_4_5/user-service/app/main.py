@@ -1,12 +1,31 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from app.database import engine
-from app.models import Base
 from app.routers import router
+from app import instrumentation, log, tracing
+import asyncio
 
-Base.metadata.create_all(bind=engine)
+log.configure_logging()
 
-app = FastAPI(title="User Service")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    exporter = asyncio.create_task(tracing.run_exporter())
+    flusher = asyncio.create_task(instrumentation.run_flusher())
+    yield
+    exporter.cancel()
+    flusher.cancel()
+    await asyncio.gather(exporter, flusher, return_exceptions=True)
+    await engine.dispose()
+
+app = FastAPI(title="User Service", lifespan=lifespan)
+
+instrumentation.instrument_engine(engine)
+tracing.instrument_engine(engine)
+app.add_middleware(instrumentation.MetricsMiddleware)
+app.add_middleware(tracing.TracingMiddleware)
+app.add_middleware(log.RequestLogMiddleware)
 
 # Configure CORS
 app.add_middleware(
@@ -22,4 +41,9 @@ app.add_middleware(
 async def health_check():
     return {"status": "healthy"}
 
+# Request latency and DB pool/query metrics in Prometheus text format
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return instrumentation.render_metrics()
+
 app.include_router(router)
\ No newline at end of file
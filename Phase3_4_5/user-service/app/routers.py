@@ -1,29 +1,46 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List
 from app import schemas, crud
 from app.database import get_db
 
 router = APIRouter(prefix="/api/users", tags=["Users"])
 
+MAX_BATCH_IDS = 500
+
 @router.post("/", response_model=schemas.UserRead, status_code=201)
-def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
+async def create_user(user: schemas.UserCreate, db: AsyncSession = Depends(get_db)):
     try:
-        return crud.create_user(db, user)
+        return await crud.create_user(db, user)
     except HTTPException as e:
         raise e
     except Exception:
         raise HTTPException(status_code=500, detail="Internal server error")
 
+@router.get("/batch", response_model=List[schemas.UserRead])
+async def get_users_batch(ids: str = Query(..., description="Comma-separated user IDs"), db: AsyncSession = Depends(get_db)):
+    try:
+        user_ids = sorted({int(i) for i in ids.split(",") if i.strip()})
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be comma-separated integers")
+    if len(user_ids) > MAX_BATCH_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_IDS} ids per request")
+    return await crud.get_users_by_ids(db, user_ids)
+
+@router.get("/summary", response_model=schemas.UserSummary)
+async def get_user_summary(db: AsyncSession = Depends(get_db)):
+    return {"total_users": await crud.count_users(db)}
+
 @router.get("/{user_id}", response_model=schemas.UserRead)
-def get_user(user_id: int, db: Session = Depends(get_db)):
-    db_user = crud.get_user_by_id(db, user_id)
+async def get_user(user_id: int, db: AsyncSession = Depends(get_db)):
+    db_user = await crud.get_user_by_id(db, user_id)
     if not db_user:
         raise HTTPException(status_code=404, detail="User not found")
     return db_user
 
 @router.put("/{user_id}", response_model=schemas.UserRead)
-def update_user(user_id: int, user_data: schemas.UserUpdate, db: Session = Depends(get_db)):
-    updated_user = crud.update_user(db, user_id, user_data)
+async def update_user(user_id: int, user_data: schemas.UserUpdate, db: AsyncSession = Depends(get_db)):
+    updated_user = await crud.update_user(db, user_id, user_data)
     if not updated_user:
         raise HTTPException(status_code=404, detail="User not found")
     return updated_user
\ No newline at end of file
@@ -26,4 +26,7 @@ class UserRead(BaseModel):
 class UserUpdate(BaseModel):
     name: Optional[str] = None
     email: Optional[EmailStr] = None
-    role: Optional[RoleEnum] = None
\ No newline at end of file
+    role: Optional[RoleEnum] = None
+
+class UserSummary(BaseModel):
+    total_users: int
@@ -0,0 +1,53 @@
+import os
+import tempfile
+import time
+
+def _cpu_count() -> int:
+    # Honours the container's CPU set, unlike os.cpu_count()
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+# Dev mode: one worker that restarts when the code changes
+reload = os.getenv("RELOAD", "false").lower() in ("1", "true", "yes")
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = 1 if reload else int(os.getenv("WEB_CONCURRENCY", _cpu_count()))
+# With several workers each one writes its metrics here and /metrics merges them (app/instrumentation.py)
+if workers > 1:
+    os.environ.setdefault("METRICS_MULTIPROC_DIR", tempfile.mkdtemp(prefix="metrics-"))
+# uvloop and httptools are picked up automatically when installed (uvicorn[standard])
+worker_class = "uvicorn.workers.UvicornWorker"
+# Import the app once in the master so workers fork with the code already loaded; connections open per worker
+preload_app = not reload and os.getenv("PRELOAD_APP", "true").lower() in ("1", "true", "yes")
+
+# In-flight requests get this long to finish on SIGTERM before the worker is killed
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+timeout = int(os.getenv("WORKER_TIMEOUT", "60"))
+# Longer than nginx's upstream keepalive so nginx, not the worker, closes idle connections
+keepalive = int(os.getenv("KEEPALIVE", "75"))
+# Recycle workers periodically to cap slow leaks; jitter avoids restarting them all at once
+max_requests = int(os.getenv("MAX_REQUESTS", "10000"))
+max_requests_jitter = int(os.getenv("MAX_REQUESTS_JITTER", "1000"))
+
+# Access logging is done by the app (app/log.py)
+accesslog = None
+errorlog = "-"
+loglevel = os.getenv("LOG_LEVEL", "info").lower()
+
+def on_starting(server):
+    # Start from zero: files left by an earlier master would be merged into this one's counters
+    directory = os.getenv("METRICS_MULTIPROC_DIR")
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        for name in os.listdir(directory):
+            if name.endswith((".json", ".json.tmp")):
+                os.remove(os.path.join(directory, name))
+
+def child_exit(server, worker):
+    # An exited worker's counters still count towards the totals; its gauges no longer do
+    directory = os.getenv("METRICS_MULTIPROC_DIR")
+    path = os.path.join(directory, f"{worker.pid}.json") if directory else None
+    if path and os.path.exists(path):
+        os.replace(path, os.path.join(directory, f"dead-{worker.pid}-{time.time_ns()}.json"))